@@ -0,0 +1,209 @@
+import argparse
+import math
+
+import numpy as np
+from scipy import stats
+
+from bcmp import load_file
+from components.topology import default_topology
+from components.users import USER_TYPES, user_types
+
+
+FCFS_STATIONS = ('FIFO_sequential', 'FIFO', 'FIFO_segmented')
+
+
+def erlang_c(c: int, offered_load: float) -> float:
+    '''
+    Probability that arriving user waits in M/M/c queue (offered_load = arrival rate * mean service time)
+    '''
+    if offered_load >= c:
+        return 1.0
+    erlang_b = 1.0
+    for k in range(1, c + 1):
+        erlang_b = offered_load * erlang_b / (k + offered_load * erlang_b)
+    return erlang_b / (1 - offered_load / c * (1 - erlang_b))
+
+
+def waiting_time(c: int, arrival_rate: float, mean_service: float, service_scv: float, arrival_scv: float = 1.0) -> float:
+    '''
+    Mean waiting time in G/G/c FCFS queue, Erlang-C scaled by Allen-Cunneen factor (exact for M/M/c)
+    '''
+    if arrival_rate == 0:
+        return 0.0
+    offered_load = arrival_rate * mean_service
+    if offered_load >= c:
+        return math.inf
+    return erlang_c(c, offered_load) * mean_service / (c - offered_load) * (arrival_scv + service_scv) / 2
+
+
+def expected_segments(mean_file_size: float, segment_size: float) -> float:
+    '''
+    Expected number of full segments floor(file_size / segment_size), file_size ~ N(mean_file_size, 1)
+    '''
+    mean = mean_file_size / segment_size
+    std = 1 / segment_size
+    ks = np.arange(max(math.floor(mean - 10 * std), 0), math.ceil(mean + 10 * std) + 1)
+    return float(np.sum(stats.norm.sf(ks[1:], loc=mean, scale=std))) + ks[0]
+
+
+def check_default_net(config: dict) -> None:
+    '''
+    The model is written for user classes USER_TYPES and stations and routes of default_topology(),
+    anything else has to be simulated
+    '''
+    if user_types(config['user']) != USER_TYPES:
+        raise ValueError(f"Analytic model covers only user classes {', '.join(USER_TYPES)}, simulate the net for other classes")
+    if config.get('topology') and config['topology'] != default_topology():
+        raise ValueError('Analytic model covers only the default topology, remove the topology section or simulate the net')
+
+
+def class_demands(config: dict) -> dict:
+    '''
+    Per class arrival rate, visits and service time moments (mean, second moment) at every station
+    of the default net
+    '''
+    check_default_net(config)
+    arrival_rate = 1 / config['user']['avg_arrival_time']
+    wages_sum = sum(config['user'][type]['arrival_wage'] for type in USER_TYPES)
+    segment_size = config['FIFO_segmented']['segment_size']
+    demands = {}
+    for type in USER_TYPES:
+        user_config = config['user'][type]
+        speed = user_config['mean_download_speed']
+        size = user_config['mean_file_size']
+        stations = {
+            'IS_input': (config['IS_input']['time'], config['IS_input']['time'] ** 2),
+            'FIFO_sequential': (config['FIFO_sequential']['time'], config['FIFO_sequential']['time'] ** 2),
+            'IS_between_servers': (config['IS_between_servers']['time'], config['IS_between_servers']['time'] ** 2),
+            'IS_output': (config['IS_output']['time'], config['IS_output']['time'] ** 2),
+        }
+        if type == 'VIP':
+            full_segments = expected_segments(size, segment_size)
+            visits = full_segments + 1
+            mean_download = size / speed / visits
+            # last segment is the remainder of file size, spread over the segment approximated as uniform
+            last_segment = size - full_segments * segment_size
+            second_moment = (full_segments * segment_size ** 2 + last_segment ** 2 + segment_size ** 2 / 12) / speed ** 2 / visits
+            stations['FIFO_segmented'] = (mean_download, second_moment)
+            visits = {station: visits for station in stations}
+            visits['IS_segmented'] = full_segments
+        else:
+            stations['FIFO'] = (size / speed, (size / speed) ** 2 + 1 / speed ** 2)
+            visits = {station: 1 for station in stations}
+        demands[type] = {
+            'arrival_rate': arrival_rate * user_config['arrival_wage'] / wages_sum,
+            'visits': visits,
+            'service': stations,
+        }
+    return demands
+
+
+def station_loads(demands: dict) -> dict:
+    '''
+    Total arrival rate, mean service time and its squared coefficient of variation at every FCFS station
+    '''
+    loads = {}
+    for station in FCFS_STATIONS:
+        flows = [
+            (demand['arrival_rate'] * demand['visits'][station], *demand['service'][station])
+            for demand in demands.values() if station in demand['service']
+        ]
+        arrival_rate = sum(rate for rate, _, _ in flows)
+        mean_service = sum(rate * mean for rate, mean, _ in flows) / arrival_rate if arrival_rate else 0.0
+        second_moment = sum(rate * moment for rate, _, moment in flows) / arrival_rate if arrival_rate else 0.0
+        service_scv = second_moment / mean_service ** 2 - 1 if mean_service else 0.0
+        loads[station] = (arrival_rate, mean_service, service_scv)
+    return loads
+
+
+def solve(config: dict) -> dict:
+    '''
+    Open multi-class network with FCFS and IS stations.
+    IS stations are exact (product form holds for any service time distribution),
+    FCFS stations use Erlang-C with Allen-Cunneen correction and Poisson arrivals,
+    which is exact for exponential service and approximate for the segmented VIP loop.
+    Times are returned in milliseconds.
+    '''
+    demands = class_demands(config)
+    loads = station_loads(demands)
+    stations = {}
+    for station in FCFS_STATIONS:
+        arrival_rate, mean_service, service_scv = loads[station]
+        channels = config[station]['number_of_channels']
+        wait = waiting_time(channels, arrival_rate, mean_service, service_scv)
+        stations[station] = {
+            'method': 'erlang-c' if math.isclose(service_scv, 1) else 'allen-cunneen',
+            'arrival_rate': arrival_rate,
+            'utilisation': arrival_rate * mean_service / channels,
+            'waiting_time': wait,
+            'mean_queue_length': arrival_rate * wait,
+            'mean_in_service': arrival_rate * mean_service,
+        }
+    for station in ('IS_input', 'IS_between_servers', 'IS_output'):
+        arrival_rate = sum(demand['arrival_rate'] * demand['visits'][station] for demand in demands.values())
+        stations[station] = {
+            'method': 'exact',
+            'arrival_rate': arrival_rate,
+            'utilisation': math.nan,
+            'waiting_time': 0.0,
+            'mean_queue_length': 0.0,
+            'mean_in_service': arrival_rate * config[station]['time'],
+        }
+
+    classes = {}
+    for type, demand in demands.items():
+        response = {}
+        for station, (mean_service, _) in demand['service'].items():
+            response[station] = (stations[station]['waiting_time'] + mean_service) * 1000
+        classes[type] = {'stations': response}
+    # time between end of segment and the next segment's request is shortened by the segment's own round trip
+    vip = demands['VIP']
+    round_trip = sum(classes['VIP']['stations'].values()) / 1000
+    segment_wait = config['IS_segmented']['segment_watchtime'] - min(round_trip, config['IS_segmented']['earlier_download'])
+    classes['VIP']['stations']['IS_segmented'] = segment_wait * 1000
+    arrival_rate = vip['arrival_rate'] * vip['visits']['IS_segmented']
+    stations['IS_segmented'] = {
+        'method': 'exact',
+        'arrival_rate': arrival_rate,
+        'utilisation': math.nan,
+        'waiting_time': 0.0,
+        'mean_queue_length': 0.0,
+        'mean_in_service': arrival_rate * segment_wait,
+    }
+
+    for type, demand in demands.items():
+        per_visit = classes[type]['stations']
+        total = {station: per_visit[station] * demand['visits'][station] for station in per_visit}
+        classes[type]['response'] = sum(total.values())
+        classes[type]['response_without_segmented'] = classes[type]['response'] - total.get('IS_segmented', 0.0)
+    for station in stations.values():
+        station['waiting_time'] *= 1000
+    return {'stations': stations, 'classes': classes}
+
+
+def print_solution(solution: dict):
+    print('Stations:')
+    for station, result in solution['stations'].items():
+        print(f"\t{station} ({result['method']})")
+        print(f"\t\tutilisation: {result['utilisation']:.4f}")
+        print(f"\t\tmean queue length: {result['mean_queue_length']:.4f}")
+        print(f"\t\tmean users in service: {result['mean_in_service']:.4f}")
+        print(f"\t\tmean waiting time: {result['waiting_time']:.4f} ms")
+    print('Response times per class [ms]:')
+    for type, result in solution['classes'].items():
+        print(f'\t{type}')
+        for station, response in result['stations'].items():
+            print(f'\t\t{station} (single visit): {response:.4f}')
+        print(f"\t\tin net: {result['response']:.4f}")
+        print(f"\t\tin net without IS_segmented: {result['response_without_segmented']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analytical solution of BCMP net')
+    parser.add_argument('-c', '--config', default='config_net.yaml')
+    args = parser.parse_args()
+    print_solution(solve(load_file(args.config)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+
+import numpy as np
+
+from components.tracing import ENTER, OUT, PROCESS, EventTrace
+
+
+def summarize_trace(trace: EventTrace, station: int | None = None) -> dict:
+    times, queue_lengths, in_service = trace.queue_series(station)
+    waiting_times = trace.phase_times(ENTER, PROCESS, station)
+    service_times = trace.phase_times(PROCESS, OUT, station)
+    users, _, _ = trace.timelines(station)
+    return {
+        'events': len(times),
+        'users': len(users),
+        'end_time': float(times[-1]) if len(times) else 0.0,
+        'max_queue_length': int(queue_lengths.max()) if len(times) else 0,
+        'max_in_service': int(in_service.max()) if len(times) else 0,
+        'avg_waiting_time': float(np.mean(waiting_times)) if len(waiting_times) else float('nan'),
+        'avg_service_time': float(np.mean(service_times)) if len(service_times) else float('nan'),
+    }
+
+
+def print_timeline(trace: EventTrace, user: int):
+    for event in trace.user_timeline(user):
+        print(f"\t{event['time']:.4f}\tsegment {event['segment'] + 1}\t{('enter', 'process', 'out')[event['kind']]}\tstation {event['station']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis of binary event trace written by simple_queue.py')
+    parser.add_argument('trace')
+    parser.add_argument('--station', type=int, default=None)
+    parser.add_argument('--user', type=int, default=None, help='print timeline of given user')
+    parser.add_argument('--plot', action='store_true', help='plot queue length rebuilt from trace')
+    args = parser.parse_args()
+
+    trace = EventTrace(args.trace)
+    print(f'Ślad {args.trace}:')
+    for key, value in summarize_trace(trace, args.station).items():
+        print(f'\t{key}: {value}')
+    if args.user is not None:
+        print(f'User {args.user}:')
+        print_timeline(trace, args.user)
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        from components.plotting import downsample_steps, figure_width_px
+
+        times, queue_lengths, in_service = trace.queue_series(args.station)
+        fig, axs = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+        end_time = times[-1] if len(times) else 1
+        for ax, values, label in ((axs[0], queue_lengths, 'Users in Queue'), (axs[1], in_service, 'Users in Service')):
+            step_times, steps = downsample_steps(times, values, end_time, figure_width_px(fig))
+            ax.stairs(steps, np.append(step_times, end_time), fill=True, label=label)
+            ax.set_ylabel(label)
+            ax.legend()
+            ax.grid(True)
+        axs[1].set_xlabel('Time')
+        fig.tight_layout()
+        plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,22 @@
-from queue import Queue
+import argparse
 import math
 from collections import defaultdict
 
 import yaml
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt
 
+from components.arrivals import PoissonArrivals, TraceArrivals
+from components.plotting import class_histograms, downsample_steps, figure_width_px
+from components.profiling import Profiler
+from components.progress import CountingEnvironment, DivergenceGuard, Progress, SnapshotWriter, combine, run_in_slices
+from components.recorder import Columns, UserTimes
+from components.statistics import LogHistogram, RunningStats, save_histograms
+from components.stopping import SequentialStopping
 from components.system import Resource
-from components.system.IS import IS
-from components.system.IS_segmented import IS_segmented
-from components.system.FIFO import FIFO
-from components.system.FIFO_segmented import FIFO_segmented
-from components.system.FIFO_sequential import FIFO_sequential
-from components.users import User
-from components.users.standard import UserStandard
-from components.users.premium import UserPremium
-from components.users.vip import UserVIP
+from components.topology import Topology, default_topology
+from components.users import User, user_class, user_types
+from components.variates import spawn_streams
 
 
 def load_file(filename):
@@ -26,141 +26,232 @@ def load_file(filename):
 
 class Net:
     
-    def __init__(self, config: dict) -> None:
+    def __init__(self, config: dict, rng: np.random.Generator | None = None, env: simpy.Environment | None = None, antithetic: bool = False) -> None:
         self.config = config
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.time = config['simulation']['time']
+        self.end_time = self.time
+        self.stopping = SequentialStopping(config['simulation']['stopping']) if 'stopping' in config['simulation'] else None
         self.avg_arrival_time = config['user']['avg_arrival_time']
-        self.users_dict = [
-            {
-                'class': UserStandard,
-                'type': 'standard'
-            },
-            {
-                'class': UserPremium,
-                'type': 'premium',
-            },
-            {
-                'class': UserVIP,
-                'type': 'VIP',
-            }
-        ]
+        self.types = user_types(config['user'])  # user classes, index is class code
+        self.users_dict = [{'class': user_class(type, code), 'type': type} for code, type in enumerate(self.types)]
         self.arrival_user_wages = []
         for user in self.users_dict:
             user_config = config['user'][user['type']]
             user['config'] = user_config
             self.arrival_user_wages.append(user_config['arrival_wage'])
-        self.users = Queue()
-        self.net_data = Queue()  # czasy użytkowników
-
-        self.env = simpy.Environment()
-        self.IS_input = IS(self.env, config['IS_input'])
-        self.FIFO_sequential = FIFO_sequential(self.env, config['FIFO_sequential'])
-        self.IS_between_servers = IS(self.env, config['IS_between_servers'])
-        self.FIFO = FIFO(self.env, config['FIFO'])
-        self.FIFO_segmented = FIFO_segmented(self.env, config['FIFO_segmented'])
-        self.IS_segmented = IS_segmented(self.env, config['IS_segmented'])
-        self.IS_output = IS(self.env, config['IS_output'])
-        self.resources = (
-            (self.IS_input, 'IS_input'), 
-            (self.FIFO_sequential, 'FIFO_sequential'),  
-            (self.IS_between_servers, 'IS_between_servers'), 
-            (self.FIFO, 'FIFO'), 
-            (self.FIFO_segmented, 'FIFO_segmented'), 
-            (self.IS_segmented, 'IS_segmented'), 
-            (self.IS_output, 'IS_output')
-        )
-
-    def create_user(self):
-        selected_user_dict = np.random.choice(self.users_dict, 1, p=self.arrival_user_wages)[0]
+        if 'trace' in config['user']:
+            trace_config = config['user']['trace']
+            self.arrivals = TraceArrivals(
+                trace_config['file'],
+                format=trace_config.get('format', 'csv'),
+                time_scale=trace_config.get('time_scale', 1.0),
+                class_map=trace_config.get('class_map'),
+                types=self.types,
+            )
+        else:
+            mean_file_sizes = [user['config']['mean_file_size'] for user in self.users_dict]
+            self.arrivals = PoissonArrivals(self.rng, self.avg_arrival_time, self.arrival_user_wages, mean_file_sizes, antithetic)
+        self.users = {}  # users in net (ordered set), with retire_users completed users are released
+        self.retire_users = config['simulation'].get('retire_users', False)
+        self.arrived = 0  # users created so far, including retired ones
+        self.completed = {  # running statistics of users that left the net
+            type: {'response': RunningStats(), 'response_without_segmented': RunningStats()}
+            for type in self.types
+        }
+        self.net_data = Columns(time='d', user_id='q', class_code='b', is_entrance='b')  # czasy użytkowników
+
+        self.env = env if env is not None else simpy.Environment()
+        self.trace = config['simulation'].get('trace', True)
+        recording = {
+            'trace': self.trace,
+            'streaming': config['simulation'].get('streaming', False),
+            'histograms': config['simulation'].get('histograms', False),
+        }
+        self.histograms = recording['histograms']
+        self.response_histograms = {  # end-to-end, per user type, empty without histograms
+            type: {'response': LogHistogram(), 'response_without_segmented': LogHistogram()}
+            for type in self.types
+        } if self.histograms else {}
+        self.topology = Topology(config.get('topology') or default_topology(self.types), config, self.types)
+        self.stations = self.topology.build_stations(self.env, **recording)  # indexed by station id
+        self.resources = tuple(zip(self.stations, self.topology.names))
+        # routing choices draw from their own substream, spawned only when the topology has any
+        self.routing = self.topology.choice_streams(spawn_streams(self.rng, ('routing',))['routing']) if self.topology.choices else []
+
+    def create_user(self, class_index: int):
+        selected_user_dict = self.users_dict[class_index]
         user = selected_user_dict['class'](selected_user_dict['config'])
         return user
     
     def register_time(self, user: User, time: float, is_entrance: bool):
-        self.net_data.put((time, user, is_entrance))
-
-    def flow(self, user: User):
+        if self.trace:
+            self.net_data.append(time, user.id, user.code, is_entrance)
+
+    def complete(self, user: User):
+        '''
+        Folds completed user into per-class aggregates, with retire_users it is also released
+        '''
+        response = self.env.now - user.enter_time[0]
+        response_without_segmented = sum(out - enter for enter, out in zip(user.enter_time, user.out_time))
+        completed = self.completed[user.type]
+        completed['response'].add(response)
+        completed['response_without_segmented'].add(response_without_segmented)
+        if self.histograms:
+            histograms = self.response_histograms[user.type]
+            histograms['response'].add(response)
+            histograms['response_without_segmented'].add(response_without_segmented)
+        if self.stopping is not None:
+            self.stopping.observe(f'response.{user.type}', response)
+            self.stopping.observe(f'response_without_segmented.{user.type}', response_without_segmented)
+        if self.retire_users:
+            del self.users[user]
+
+    def flow(self, user: User, file_size: float):
         self.register_time(user, self.env.now, True)
-        file_size = abs(np.random.normal(user.mean_file_size))
-
-        if isinstance(user, UserVIP):       
-            full_segments_number = math.floor(file_size / self.FIFO_segmented.segment_size)
-            segments = [self.FIFO_segmented.segment_size for _ in range(full_segments_number)]
-
-            for segment in segments:
-                user.enter(self.env.now)
-                yield self.IS_input.process(user)
-                yield self.FIFO_sequential.process(user)
-                yield self.IS_between_servers.process(user)
-
-                download_time = segment / user.mean_download_speed
-                yield self.FIFO_segmented.process(user, download_time)
-                yield self.IS_output.process(user)
-                user.out(self.env.now)
-                yield self.IS_segmented.process(user)
-            
-            user.enter(self.env.now)
-            yield self.IS_input.process(user)
-            yield self.FIFO_sequential.process(user)
-            yield self.IS_between_servers.process(user)
-
-            download_time = (file_size - full_segments_number * self.FIFO_segmented.segment_size) / user.mean_download_speed
-            yield self.FIFO_segmented.process(user, download_time)
-            yield self.IS_output.process(user)
-            user.out(self.env.now)
-
+        topology = self.topology
+        stations = self.stations
+        takes_work = topology.takes_work
+        route = topology.routes[user.code]
+        segment_size = topology.segment_sizes[user.code]
+
+        if segment_size is None:
+            parts = [file_size]
         else:
-            user.enter(self.env.now)
-            yield self.IS_input.process(user)
-            yield self.FIFO_sequential.process(user)
-            yield self.IS_between_servers.process(user)
+            full_segments_number = math.floor(file_size / segment_size)
+            parts = [segment_size] * full_segments_number
+            parts.append(file_size - full_segments_number * segment_size)
+        last_part = len(parts) - 1
 
-            download_time = file_size / user.mean_download_speed
-            yield self.FIFO.process(user, download_time)
-            yield self.IS_output.process(user)
+        for i, part in enumerate(parts):
+            user.enter(self.env.now)
+            download_time = part / user.mean_download_speed
+            for hop in route:
+                if hop < 0:
+                    ids, choices = self.routing[-hop - 1]
+                    hop = ids[choices.next()]
+                if takes_work[hop]:
+                    yield from stations[hop].visit(user, download_time)
+                else:
+                    yield from stations[hop].visit(user)
             user.out(self.env.now)
+            if i < last_part:
+                for station_id in topology.between[user.code]:
+                    yield from stations[station_id].visit(user)
+        for station_id in topology.releases[user.code]:
+            stations[station_id].release(user)
 
         self.register_time(user, self.env.now, False)
+        self.complete(user)
     
     def gen_users(self):
+        for arrival_time, class_index, file_size in self.arrivals:
+            yield self.env.timeout(arrival_time - self.env.now)
+            user = self.create_user(class_index)
+            self.arrived += 1
+            self.users[user] = None
+            self.env.process(self.flow(user, file_size))
+
+    def attach_profiler(self, profiler: Profiler):
+        '''
+        Instruments user flow and every station visit, has to be called before run
+        '''
+        for resource, resource_str in self.resources:
+            profiler.instrument(resource, 'visit', resource_str)
+        profiler.instrument(self, 'flow', 'flow')
+        self.env.process(profiler.sample())
+
+    def observe_stations(self):
+        stations = {resource_str: resource for resource, resource_str in self.resources}
+        station_metrics = list(self.stopping.station_metrics())
         while True:
-            yield self.env.timeout(np.random.exponential(self.avg_arrival_time))
-            user = self.create_user()
-            self.users.put(user)
-            self.env.process(self.flow(user))
-
-    def run(self):
+            yield self.env.timeout(self.stopping.observation_interval)
+            for metric, kind, station in station_metrics:
+                queue_length, in_service = stations[station].current_state()
+                self.stopping.observe(metric, queue_length if kind == 'queue_length' else in_service)
+
+    def snapshot(self, progress: Progress) -> dict:
+        '''
+        Current state of stations and running means of completed users, for live monitoring
+        '''
+        stations = {}
+        for resource, resource_str in self.resources:
+            queue_length, in_service = resource.current_state()
+            capacity = resource.resource.capacity if resource.resource is not None else None
+            stations[resource_str] = {
+                'queue_length': queue_length,
+                'in_service': in_service,
+                'utilisation': in_service / capacity if capacity else None,
+            }
+        classes = {
+            type: {
+                'completed': stats['response'].count,
+                'response': stats['response'].mean if stats['response'].count else None,
+                'response_without_segmented': stats['response_without_segmented'].mean if stats['response'].count else None,
+            }
+            for type, stats in self.completed.items()
+        }
+        return {'time': self.env.now, **progress.rates(), 'users_in_net': len(self.users), 'stations': stations, 'classes': classes}
+
+    def run(self, observer=None, snapshot_interval: float = 60):
+        '''
+        Runs until simulation time, or with stopping configured until the chosen metrics are precise enough
+        (simulation time is then the upper limit).
+        With observer, every snapshot_interval of simulated time observer(snapshot) is called,
+        returning True aborts the run (self.aborted is then set).
+        '''
         self.env.process(self.gen_users())
-        self.env.run(until=self.time)
+        self.aborted = False
+        checks = []
+        if self.stopping is not None:
+            self.env.process(self.observe_stations())
+            checks.append((self.stopping.check_interval, self.stopping.is_precise))
+        if observer is not None:
+            progress = Progress(self.env)
+
+            def observe():
+                self.aborted = bool(observer(self.snapshot(progress)))
+                return self.aborted
+            checks.append((snapshot_interval, observe))
+        if checks:
+            run_in_slices(self.env, self.time, checks)
+        else:
+            self.env.run(until=self.time)
+        self.end_time = self.env.now
 
 
 def plot_queue_and_service_data(system, end_time):  
+    import matplotlib.pyplot as plt
+
     if not system.net_data:
         print("Brak danych do wyświetlenia wykresów.")
         return
 
-    net_data = defaultdict(lambda: defaultdict(list))
-    
-    times, users, is_entrances = zip(*system.net_data.queue)
-    
-    types = ('standard', 'premium', 'VIP', 'all')
-    
-    for type in types:
-        net_data[type]['in_net_numbers'] = [0]
-    for time, user, is_entrance in zip(times, users, is_entrances):
-        net_data[user.type]['times'].append(time)
-        net_data[user.type]['in_net_numbers'].append(net_data[user.type]['in_net_numbers'][-1] + (1 if is_entrance else -1))
-        net_data['all']['in_net_numbers'].append(net_data['all']['in_net_numbers'][-1] + (1 if is_entrance else -1))
-    net_data['all']['times'] = times
+    times = system.net_data['time']
+    class_codes = system.net_data['class_code']
+    steps = np.where(system.net_data['is_entrance'], 1, -1)
+
+    types = system.types + ('all',)
+
+    net_data = defaultdict(dict)
+    for code, type in enumerate(system.types):
+        mask = class_codes == code
+        net_data[type]['times'] = np.concatenate(([0], times[mask]))
+        net_data[type]['in_net_numbers'] = np.concatenate(([0], np.cumsum(steps[mask])))
+    net_data['all']['times'] = np.concatenate(([0], times))
+    net_data['all']['in_net_numbers'] = np.concatenate(([0], np.cumsum(steps)))
     
-    fig, axs = plt.subplots(4, 1, figsize=(8, 6), sharex=True)
+    fig, axs = plt.subplots(len(types), 1, figsize=(8, 6), sharex=True)
+    width = figure_width_px(fig)
     
     for i, type in enumerate(types):
-        axs[i].stairs(net_data[type]['in_net_numbers'], [0] + list(net_data[type]['times']) + [end_time], fill=True, color='green', label=type)
+        step_times, in_net_numbers = downsample_steps(net_data[type]['times'], net_data[type]['in_net_numbers'], end_time, width)
+        axs[i].stairs(in_net_numbers, np.append(step_times, end_time), fill=True, color='green', label=type)
         axs[i].set_xlabel('Time')
         axs[i].set_ylabel('Users in net')
         axs[i].set_title(f"Number of users in net over time - {type}")
         axs[i].legend()
-        max_in_service = max(net_data[type]['in_net_numbers']) if net_data[type]['in_net_numbers'] else 1
+        max_in_service = max(in_net_numbers)
         axs[i].set_ylim(0, max_in_service + 1)
         axs[i].set_xlim(0, end_time)
         axs[i].grid(True)
@@ -168,32 +259,25 @@ def plot_queue_and_service_data(system, end_time):
     fig.tight_layout()
     fig.show()
     
-    print('Mean times:')
     for resource, resource_str in system.resources:
-        print(f'\t{resource_str}')
-        print(f'\t\tin system: {np.mean([tup[0] for tup in resource.times_in_system.queue])}')
-        print(f'\t\tin service: {np.mean([tup[0] for tup in resource.times_in_service.queue])}')
-        print(f'\t\tin queue: {np.mean([tup[0] for tup in resource.times_in_queue.queue])}')
-        queue_data = defaultdict(list)
-        in_service_data = defaultdict(list)
-        resource_queue_data = resource.queue_data.queue
-        resource_in_service_data = resource.in_service_data.queue
-        
-        for tup1, tup2 in zip(resource_queue_data, resource_in_service_data):
-            queue_data['times'].append(tup1[0])
-            queue_data['data'].append(tup1[2])
-            in_service_data['times'].append(tup2[0])
-            in_service_data['data'].append(tup2[2])
+        if not resource.trace:
+            continue
+        visits = resource.visits.as_dict()
+        sample_times = resource.samples['time']
+        queue_data = {'times': sample_times, 'data': resource.samples['queue_length']}
+        in_service_data = {'times': sample_times, 'data': resource.samples['in_service']}
             
         fig, axs = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+        width = figure_width_px(fig)
         
         for i, q_data in enumerate((queue_data, in_service_data)):
-            axs[i].stairs(q_data['data'], q_data['times'] + [end_time], fill=True, color='green' if i else 'blue', label='service' if i else 'queue')
+            step_times, data = downsample_steps(q_data['times'], q_data['data'], end_time, width)
+            axs[i].stairs(data, np.append(step_times, end_time), fill=True, color='green' if i else 'blue', label='service' if i else 'queue')
             axs[i].set_xlabel('Time')
             axs[i].set_ylabel('Users')
             axs[i].set_title(f"Number of users in {'service' if i else 'queue'} in {resource_str}")
             axs[i].legend()
-            max_in_service = max(q_data['data']) if q_data['data'] else 1
+            max_in_service = data.max() if len(data) else 1
             axs[i].set_ylim(0, max_in_service + 1)
             axs[i].set_xlim(0, end_time)
             axs[i].grid(True)
@@ -201,50 +285,91 @@ def plot_queue_and_service_data(system, end_time):
         fig.tight_layout()
         fig.show()
 
-        hist_data = defaultdict(lambda: defaultdict(list))
-
-        for type in types:
-            hist_data['system'][type] = [tup[0] for tup in resource.times_in_system.queue if tup[1].type == type or type == 'all']
-            hist_data['queue'][type] = [tup[0] for tup in resource.times_in_queue.queue if tup[1].type == type or type == 'all']
-            hist_data['service'][type] = [tup[0] for tup in resource.times_in_service.queue if tup[1].type == type or type == 'all']
-        
-        for i, (time_type, time_dict) in enumerate(hist_data.items()):
-            fig, axs = plt.subplots(4, 1, figsize=(8, 6), sharex=True)
-            for j, (data_type, data_list) in enumerate(time_dict.items()):
-                axs[j].hist(data_list, bins=50, color='blue', alpha=0.7, label=f'{time_type} - {data_type}')
+        for time_type in ('system', 'queue', 'service'):
+            counts, edges = class_histograms(visits[time_type], visits['class_code'], len(system.types), bins=50)
+            fig, axs = plt.subplots(len(types), 1, figsize=(8, 6), sharex=True)
+            for j, data_type in enumerate(types):
+                axs[j].stairs(counts[j], edges, fill=True, color='blue', alpha=0.7, label=f'{time_type} - {data_type}')
                 axs[j].set_xlabel('Time')
                 axs[j].set_ylabel('Number of users')
                 axs[j].set_title(f'Histogram of users in {resource_str} - time spended in {time_type} - type: {data_type}')
                 axs[j].legend()
                 axs[j].grid(True)
         
-        fig.tight_layout()
-        fig.show()
+            fig.tight_layout()
+            fig.show()
 
-def calculate_statistics(system: Resource, end_time):
-    service_times = defaultdict(list)
-    service_times_with_segmented = defaultdict(list)
-
-    for user in system.users.queue:
-        enter_time_len = len(user.enter_time)
-        times = 0
-        for i in range(len(user.enter_time) - 1):
-            times += user.out_time[i] - user.enter_time[i]
-        if enter_time_len == len(user.out_time):
-            times += user.out_time[-1] - user.enter_time[-1]
-            service_times_with_segmented[user.type].append(user.out_time[-1] - user.enter_time[0])
-        else:
-            times += end_time - user.enter_time[-1]
-            service_times_with_segmented[user.type].append(end_time - user.enter_time[0])
-        service_times[user.type].append(times)
-
-    types = ('standard', 'premium', 'VIP')
 
-    avg_service_time = {}
-    avg_service_time_with_segmented = {}
-    for type in types:
-        avg_service_time[type] = np.mean(service_times[type]) if service_times[type] else 0
-        avg_service_time_with_segmented[type] = np.mean(service_times_with_segmented[type]) if service_times_with_segmented[type] else 0
+def print_mean_times(system, end_time):
+    print('Mean times:')
+    for resource, resource_str in system.resources:
+        print(f'\t{resource_str}')
+        if not resource.trace:
+            print_streaming_summary(resource, end_time)
+            continue
+        print(f'\t\tin system: {np.mean(resource.visits["system"])}')
+        print(f'\t\tin service: {np.mean(resource.visits["service"])}')
+        print(f'\t\tin queue: {np.mean(resource.visits["queue"])}')
+        for time_type in ('system', 'queue'):
+            class_means = ', '.join(f'{type}: {mean}' for type, mean in station_class_means(resource, time_type).items())
+            print(f'\t\tin {time_type} per class: {class_means}')
+
+
+def station_class_means(resource: Resource, time_type: str) -> dict:
+    '''
+    Mean time of visits per user class, from traced visits
+    '''
+    class_stats = RunningStats.grouped(resource.visits[time_type], resource.visits['class_code'], len(resource.types))
+    return {type: class_stats[code].mean if class_stats[code].count else math.nan for code, type in enumerate(resource.types)}
+
+
+def print_streaming_summary(resource: Resource, end_time):
+    summary = resource.streaming_summary(end_time)
+    for time_type in ('system', 'service', 'queue'):
+        all_stats = summary[time_type]['all']
+        print(f"\t\tin {time_type}: {all_stats['mean']} (std: {all_stats['variance'] ** 0.5}, min: {all_stats['min']}, max: {all_stats['max']}, n: {all_stats['count']})")
+    for time_type in ('system', 'queue'):
+        class_means = ', '.join(f"{type}: {summary[time_type][type]['mean']}" for type in resource.types if type in summary[time_type])
+        print(f'\t\tin {time_type} per class: {class_means}')
+    print(f"\t\tmean queue length: {summary['queue_length']['mean']}")
+    print(f"\t\tmean users in service: {summary['in_service']['mean']}")
+
+
+def collect_user_times(system: Net, end_time):
+    '''
+    Returns class codes of users and per-user time spent in net, without and with time spended in IS_segmented
+    '''
+    user_times = UserTimes(system.users, end_time)
+    return user_times.class_codes, user_times.times_in_visits(), user_times.times_in_system()
+
+
+def user_statistics(system: Net, end_time):
+    '''
+    Per-class accumulators of time spent in net, with and without time spended in IS_segmented.
+    Users still in net are counted up to end_time, with retire_users completed users come from aggregates.
+    '''
+    class_codes, service_times, service_times_with_segmented = collect_user_times(system, end_time)
+    in_net = RunningStats.grouped(service_times, class_codes, len(system.types))
+    in_net_with_segmented = RunningStats.grouped(service_times_with_segmented, class_codes, len(system.types))
+    if not system.retire_users:
+        return {
+            type: {'response': in_net_with_segmented[code], 'response_without_segmented': in_net[code]}
+            for code, type in enumerate(system.types)
+        }
+    return {
+        type: {
+            'response': in_net_with_segmented[code].merge(system.completed[type]['response']),
+            'response_without_segmented': in_net[code].merge(system.completed[type]['response_without_segmented']),
+        }
+        for code, type in enumerate(system.types)
+    }
+
+
+def calculate_statistics(system: Net, end_time, plot: bool = True):
+    statistics = user_statistics(system, end_time)
+
+    avg_service_time = {type: stats['response_without_segmented'].mean for type, stats in statistics.items()}
+    avg_service_time_with_segmented = {type: stats['response'].mean for type, stats in statistics.items()}
     
     print("Wyniki:\n")
     print(f"Średni czas w systemie:")
@@ -255,37 +380,210 @@ def calculate_statistics(system: Resource, end_time):
         print(f"\t{key}: {val}")
     print('')
 
-    fig, axs = plt.subplots(4, 1, figsize=(8, 6), sharex=True)
+    if plot:
+        if system.retire_users:
+            print('Histogram czasów w systemie niedostępny - zakończeni użytkownicy nie są przechowywani.')
+        else:
+            class_codes, service_times, _ = collect_user_times(system, end_time)
+            plot_service_times(service_times, class_codes, system.types)
+    return avg_service_time, avg_service_time_with_segmented
+
+
+def plot_service_times(service_times, class_codes, types: tuple):
+    import matplotlib.pyplot as plt
+
+    counts, edges = class_histograms(service_times, class_codes, len(types), bins=20)
+    fig, axs = plt.subplots(len(types) + 1, 1, figsize=(8, 6), sharex=True)
         
-    for i, type in enumerate(types):
-        axs[i].hist(service_times[type], bins=20, color='blue', alpha=0.7, label=f"Histogram - {type}")
+    for i, type in enumerate(types + ('all',)):
+        axs[i].stairs(counts[i], edges, fill=True, color='blue', alpha=0.7, label=f"Histogram - {type}")
         axs[i].set_xlabel('Time')
         axs[i].set_ylabel('Number of users')
         axs[i].set_title(f'Histogram of users in net - {type}')
         axs[i].legend()
         axs[i].grid(True)
-    
-    axs[3].hist([item for lst in service_times.values() for item in lst], bins=20, color='blue', alpha=0.7, label=f"Histogram - all")
-    axs[3].set_xlabel('Number of users')
-    axs[3].set_ylabel('Frequency')
-    axs[3].set_title(f'Histogram of users in net - all')
-    axs[3].legend()
-    axs[3].grid(True)
 
     fig.tight_layout()
     fig.show()
 
+
+def summarize_net(net: Net, end_time) -> dict:
+    '''
+    Flattens results of a single run into {metric: value},
+    e.g. 'class.VIP.response' or 'station.FIFO.queue'
+    '''
+    summary = {}
+    for type, stats in user_statistics(net, end_time).items():
+        summary[f'class.{type}.response'] = stats['response'].as_dict()['mean']
+        summary[f'class.{type}.response_without_segmented'] = stats['response_without_segmented'].as_dict()['mean']
+    for resource, resource_str in net.resources:
+        if resource.streaming:
+            streaming_summary = resource.streaming_summary(end_time)
+            for time_type in ('system', 'service', 'queue'):
+                summary[f'station.{resource_str}.{time_type}'] = streaming_summary[time_type]['all']['mean']
+            summary[f'station.{resource_str}.queue_length'] = streaming_summary['queue_length']['mean']
+            summary[f'station.{resource_str}.in_service'] = streaming_summary['in_service']['mean']
+            for type in net.types:
+                class_stats = streaming_summary['system'].get(type)
+                summary[f'station.{resource_str}.system.{type}'] = class_stats['mean'] if class_stats else math.nan
+        else:
+            for time_type in ('system', 'service', 'queue'):
+                summary[f'station.{resource_str}.{time_type}'] = _mean(resource.visits[time_type])
+            for type, mean in station_class_means(resource, 'system').items():
+                summary[f'station.{resource_str}.system.{type}'] = mean
+    for resource, resource_str in stalling_stations(net):
+        # users still watching at end_time count with their stalls so far, long playbacks rarely end within the horizon
+        stall_statistics = resource.stall_statistics(end_time)
+        for metric, per_class in stall_statistics['all'].items():
+            for type in net.types:
+                summary[f'station.{resource_str}.{metric}.{type}'] = per_class[type].mean if per_class[type].count else math.nan
+        for type in net.types:
+            summary[f'station.{resource_str}.playbacks_in_progress.{type}'] = stall_statistics['in_progress']['stalls'][type].count
+    if net.histograms:
+        for type, class_histograms in net.response_histograms.items():
+            for metric, histogram in class_histograms.items():
+                summary[f'class.{type}.{metric}.p95'] = histogram.percentile(95)
+                summary[f'class.{type}.{metric}.p99'] = histogram.percentile(99)
+    return summary
+
+
+def stalling_stations(net: Net) -> list:
+    '''
+    (station, name) of stations following playback of users (IS_segmented)
+    '''
+    return [(resource, resource_str) for resource, resource_str in net.resources if hasattr(resource, 'stall_stats')]
+
+
+STALL_GROUPS = {
+    'completed': 'pobrali cały plik',
+    'in_progress': 'oglądają w chwili zakończenia, przerwy dotychczas',
+    'all': 'wszyscy',
+}
+
+
+def print_stalls(net: Net, end_time):
+    print('Przerwy w odtwarzaniu:')
+    for resource, resource_str in stalling_stations(net):
+        print(f'\t{resource_str} (prefetch: {resource.config.get("prefetch", "fixed")})')
+        stall_statistics = resource.stall_statistics(end_time)
+        for group, description in STALL_GROUPS.items():
+            print(f'\t\t{description}:')
+            counted = [type for type in net.types if stall_statistics[group]['stalls'][type].count]
+            for type in counted:
+                stalls, stall_time = stall_statistics[group]['stalls'][type], stall_statistics[group]['stall_time'][type]
+                print(f'\t\t\t{type}: średnio {stalls.mean} przerw, {stall_time.mean} s (max: {stalls.max} przerw, {stall_time.max} s, n: {stalls.count})')
+            if not counted:
+                print('\t\t\tbrak użytkowników')
+    print('')
+
+
+def net_histograms(net: Net) -> dict:
+    '''
+    Flat {name: LogHistogram} of completed users and station visits, named as in summarize_net,
+    e.g. 'class.VIP.response' or 'station.FIFO.system.premium', empty when histograms were not recorded
+    '''
+    histograms = {}
+    if not net.histograms:
+        return histograms
+    for type, class_histograms in net.response_histograms.items():
+        for metric, histogram in class_histograms.items():
+            histograms[f'class.{type}.{metric}'] = histogram
+    for resource, resource_str in net.resources:
+        for time_type, per_class in resource.latency_histograms.items():
+            for code, type in enumerate(net.types):
+                histograms[f'station.{resource_str}.{time_type}.{type}'] = per_class[code]
+    return histograms
+
+
+def print_percentiles(histograms: dict, percentiles=(50, 95, 99)):
+    print('Percentyle czasów (użytkownicy, którzy opuścili sieć):')
+    for name, histogram in histograms.items():
+        if name.startswith('class.') and histogram.count:
+            print(f"\t{name}: {', '.join(f'p{p}: {histogram.percentile(p):.4f}' for p in percentiles)} (n: {histogram.count})")
+    print('')
+
+
+def _mean(values):
+    return float(np.mean(values)) if len(values) else math.nan
+
+
+def export_results(net: Net, end_time, filename):
+    '''
+    Saves net and per-station series together with the run summary into a single .npz file
+    '''
+    arrays = {f'net.{name}': column for name, column in net.net_data.as_dict().items()}
+    for resource, resource_str in net.resources:
+        if resource.trace:
+            arrays.update({f'{resource_str}.samples.{name}': column for name, column in resource.samples.as_dict().items()})
+            arrays.update({f'{resource_str}.visits.{name}': column for name, column in resource.visits.as_dict().items()})
+    arrays.update({f'summary.{metric}': np.array(value) for metric, value in summarize_net(net, end_time).items()})
+    np.savez_compressed(filename, **arrays)
+
+
+def print_stopping_report(net: Net):
+    print(f'Symulacja zakończona w czasie {net.end_time}:')
+    for metric, estimate in net.stopping.report().items():
+        print(f"\t{metric}: {estimate['mean']} ± {estimate['half_width']} (warm-up: {estimate['warmup']} / {estimate['observations']} obserwacji)")
+    print('')
+
+
 def main():
-    config = load_file('config_net.yaml')
+    parser = argparse.ArgumentParser(description='Simulation of BCMP net')
+    parser.add_argument('-c', '--config', default='config_net.yaml')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('--no-plot', action='store_true', help='do not import matplotlib nor build figures')
+    parser.add_argument('--export', metavar='FILE', help='save series and summary to .npz file')
+    parser.add_argument('--profile', metavar='FILE', help='print per station profile and save collapsed stacks to file')
+    parser.add_argument('--snapshots', metavar='FILE', help='write periodic snapshots to rotating .jsonl or .npz file')
+    parser.add_argument('--snapshot-interval', type=float, default=60, help='simulated seconds between snapshots')
+    parser.add_argument('--abort-diverging', action='store_true', help='stop when queue of some station keeps growing')
+    parser.add_argument('--histograms', metavar='FILE', help='record latency histograms and save them to JSON file')
+    args = parser.parse_args()
+
+    config = load_file(args.config)
+    if args.histograms:
+        config['simulation']['histograms'] = True
     
-    net = Net(config=config)
-    net.run()
+    net = Net(config=config, rng=np.random.default_rng(args.seed), env=CountingEnvironment() if args.snapshots else None)
+    if args.profile:
+        profiler = Profiler(net.env)
+        net.attach_profiler(profiler)
+    observers = []
+    if args.snapshots:
+        writer = SnapshotWriter(args.snapshots)
+        observers.append(writer)
+    if args.abort_diverging:
+        guard = DivergenceGuard()
+        observers.append(guard)
+    net.run(observer=combine(*observers) if observers else None, snapshot_interval=args.snapshot_interval)
+    if args.snapshots:
+        writer.close()
+    if net.aborted:
+        print(f'Symulacja przerwana w czasie {net.end_time}: rosnąca kolejka w {guard.diverging}\n')
+    if args.profile:
+        profiler.print_table()
+        profiler.write_collapsed(args.profile)
     
-    end_time = config['simulation']['time']
-    calculate_statistics(net, end_time=end_time)
-    plot_queue_and_service_data(net, end_time=end_time)
-
-    plt.show()
+    end_time = net.end_time
+    if net.stopping is not None:
+        print_stopping_report(net)
+    calculate_statistics(net, end_time=end_time, plot=not args.no_plot)
+    if net.histograms:
+        histograms = net_histograms(net)
+        print_percentiles(histograms)
+        if args.histograms:
+            save_histograms(histograms, args.histograms)
+    print_mean_times(net, end_time=end_time)
+    if stalling_stations(net):
+        print('')
+        print_stalls(net, end_time)
+    if args.export:
+        export_results(net, end_time, args.export)
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+
+        plot_queue_and_service_data(net, end_time=end_time)
+        plt.show()
 
 
 if __name__ == '__main__':
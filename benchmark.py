@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import simpy
+
+from bcmp import Net, load_file
+from components.progress import CountingEnvironment
+from simple_queue import QueueSystem, QueueSystemLindley
+from sweep import set_parameter
+
+
+# name -> model, base config, dotted path overrides
+SCENARIOS = {
+    'net_base': ('net', 'config_net.yaml', {'simulation.time': 600}),
+    'net_load_x0.5': ('net', 'config_net.yaml', {'simulation.time': 600, 'user.avg_arrival_time': 2}),
+    'net_load_x2': ('net', 'config_net.yaml', {'simulation.time': 600, 'user.avg_arrival_time': 0.5}),
+    'net_vip_0.3': ('net', 'config_net.yaml', {
+        'simulation.time': 600,
+        'user.standard.arrival_wage': 0.5,
+        'user.premium.arrival_wage': 0.2,
+        'user.VIP.arrival_wage': 0.3,
+    }),
+    'net_long': ('net', 'config_net.yaml', {'simulation.time': 3600}),
+    # FIFO_segmented with 5 channels close to saturation: 0.45 VIP/s * 100 segments * 0.1 s / 5 = 0.9 in steady state.
+    # Short watch time lets VIP playbacks (100 segments) finish within ~200 s, so the horizon is mostly past ramp-up,
+    # and FIFO_sequential, which every segment passes first, gets channels enough not to throttle the segments
+    'net_segmented_saturation': ('net', 'config_net.yaml', {
+        'simulation.time': 1800,
+        'user.standard.arrival_wage': 0.35,
+        'user.premium.arrival_wage': 0.2,
+        'user.VIP.arrival_wage': 0.45,
+        'IS_segmented.segment_watchtime': 2,
+        'IS_segmented.earlier_download': 1,
+        'FIFO_sequential.number_of_channels': 4,
+    }),
+    'net_streaming': ('net', 'config_net.yaml', {'simulation.time': 600, 'simulation.trace': False, 'simulation.streaming': True}),
+    'queue': ('queue', 'config_queue.yaml', {'time': 3600}),
+    'queue_segmented': ('queue_segmented', 'config_queue.yaml', {'time': 3600}),
+    'queue_lindley': ('queue_lindley', 'config_queue.yaml', {'time': 3600}),
+}
+
+# scenario -> (station, min, max) of its mean utilisation over the whole run (ramp-up included),
+# checked after every run so that the scenario cannot drift away from what it is meant to load
+EXPECTED_UTILISATION = {
+    'net_segmented_saturation': ('FIFO_segmented', 0.75, 0.95),
+}
+
+
+def peak_rss() -> int:
+    '''
+    Peak resident set size of this process in bytes
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def station_utilisation(net: Net, station: str) -> float:
+    '''
+    Busy time of traced visits per channel and simulated second
+    '''
+    resource = net.stations[net.topology.ids[station]]
+    return float(resource.visits['service'].sum()) / net.end_time / resource.resource.capacity
+
+
+def run_scenario(name: str, seed: int) -> dict:
+    model, config_file, overrides = SCENARIOS[name]
+    config = copy.deepcopy(load_file(config_file))
+    for path, value in overrides.items():
+        set_parameter(config, path, value)
+    rng = np.random.default_rng(seed)
+    env = CountingEnvironment()
+
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    if model == 'net':
+        system = Net(config, rng=rng, env=env)
+        system.run()
+        requests = system.arrived
+        simulated_time = system.end_time
+    else:
+        if model == 'queue_lindley':
+            system = QueueSystemLindley(is_segmented=False, config=config, rng=rng)
+        else:
+            system = QueueSystem(is_segmented=model == 'queue_segmented', config=config, rng=rng, env=env)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            system.run()
+        requests = system.users.qsize()
+        simulated_time = config['time']
+    wall_time = time.perf_counter() - start
+    rss_after = peak_rss()
+
+    utilisation = None
+    if name in EXPECTED_UTILISATION:
+        station, low, high = EXPECTED_UTILISATION[name]
+        utilisation = station_utilisation(system, station)
+        if not low <= utilisation <= high:
+            raise RuntimeError(f'Scenario {name} drifted: utilisation of {station} is {utilisation:.3f}, expected {low} - {high}')
+
+    return {
+        'wall_time': wall_time,
+        'events': env.processed_events,
+        'events_per_second': env.processed_events / wall_time if env.processed_events else None,
+        'simulated_seconds_per_second': simulated_time / wall_time,
+        'requests': requests,
+        'peak_rss': rss_after,
+        'bytes_per_request': (rss_after - rss_before) / requests if requests else None,
+        'utilisation': utilisation,
+    }
+
+
+def run_isolated(name: str, seed: int) -> dict:
+    '''
+    Every scenario runs in a fresh process, so peak RSS is not inherited from previous scenarios
+    '''
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_scenario, (name, seed))
+
+
+def run_benchmarks(names, repeat: int, seed: int) -> dict:
+    results = {}
+    for name in names:
+        runs = [run_isolated(name, seed + i) for i in range(repeat)]
+        best = min(runs, key=lambda run: run['wall_time'])
+        results[name] = best
+        events_per_second = f"{best['events_per_second']:.0f}" if best['events_per_second'] else '-'
+        print(f"{name}: {best['wall_time']:.3f} s, {best['events']} events, {events_per_second} events/s, "
+              f"peak RSS {best['peak_rss'] / 2**20:.1f} MiB, {best['requests']} requests"
+              + (f", utilisation {best['utilisation']:.3f}" if best.get('utilisation') is not None else ''))
+    return {
+        'python': platform.python_version(),
+        'simpy': simpy.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'seed': seed,
+        'scenarios': results,
+    }
+
+
+# metric -> True if higher value is better
+COMPARED_METRICS = {
+    'wall_time': False,
+    'events_per_second': True,
+    'peak_rss': False,
+    'bytes_per_request': False,
+}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    '''
+    Returns list of (scenario, metric, baseline, current, relative change) worse than threshold
+    '''
+    regressions = []
+    for name, result in current['scenarios'].items():
+        if name not in baseline['scenarios']:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = baseline['scenarios'][name][metric], result[metric]
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and memory benchmarks of simulators')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('-o', '--output', default='benchmark.json')
+    run_parser.add_argument('-s', '--scenarios', nargs='*', default=list(SCENARIOS), choices=list(SCENARIOS))
+    run_parser.add_argument('-r', '--repeat', type=int, default=3, help='best of given number of runs is kept')
+    run_parser.add_argument('--seed', type=int, default=0)
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1, help='relative change treated as regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run_benchmarks(args.scenarios, args.repeat, args.seed)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        return
+
+    with open(args.baseline, 'r') as file:
+        baseline = json.load(file)
+    with open(args.current, 'r') as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, old, new, change in regressions:
+        print(f'REGRESSION {name} {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})')
+    if not regressions:
+        print('No regressions.')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
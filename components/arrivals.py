@@ -0,0 +1,110 @@
+import csv
+
+import numpy as np
+
+from .users import USER_TYPES
+from .variates import choice_stream, exponential_stream, spawn_streams, standard_normal_stream
+
+
+TRACE_DTYPE = np.dtype([('time', '<f8'), ('class', '<i4'), ('file_size', '<f8')]) # record of binary trace
+
+
+class PoissonArrivals:
+    '''
+    Poisson arrivals with fixed class mix and file size |N(mean file size of class, 1)|,
+    iterates over (arrival time, class index, file size).
+    Every purpose has its own substream, antithetic mirrors all of them.
+    '''
+
+    def __init__(self, rng: np.random.Generator, avg_arrival_time: float, class_probabilities, mean_file_sizes, antithetic: bool = False) -> None:
+        streams = spawn_streams(rng, ('arrivals', 'classes', 'file_sizes'))
+        self.interarrival_times = exponential_stream(streams['arrivals'], avg_arrival_time, antithetic=antithetic)
+        self.user_classes = choice_stream(streams['classes'], class_probabilities, antithetic=antithetic)
+        self.file_size_deviations = standard_normal_stream(streams['file_sizes'], antithetic=antithetic)
+        self.mean_file_sizes = mean_file_sizes
+
+    def __iter__(self):
+        time = 0.0
+        while True:
+            time += self.interarrival_times.next()
+            class_index = self.user_classes.next()
+            yield time, class_index, abs(self.mean_file_sizes[class_index] + self.file_size_deviations.next())
+
+
+class TraceArrivals:
+    '''
+    Replays recorded arrivals streamed from file, never loading it whole:
+        csv - rows of timestamp, class (user type or class code), file size in MB, optional header
+        binary - records of TRACE_DTYPE, memory-mapped and read in chunks
+    Timestamps are made relative to the first record and multiplied by time_scale,
+    class_map renames classes of the trace to user types, class codes are indexes in types.
+    '''
+
+    def __init__(self, filename: str, format: str = 'csv', time_scale: float = 1.0, class_map: dict | None = None, chunk_size: int = 65536, types: tuple = USER_TYPES) -> None:
+        if format not in ('csv', 'binary'):
+            raise ValueError(f'Unknown trace format: {format}')
+        self.filename = filename
+        self.format = format
+        self.time_scale = time_scale
+        self.class_map = class_map or {}
+        self.chunk_size = chunk_size
+        self.types = types
+
+    def class_index(self, trace_class) -> int:
+        trace_class = self.class_map.get(trace_class, trace_class)
+        if isinstance(trace_class, str) and not trace_class.isdigit():
+            return self.types.index(trace_class)
+        return int(trace_class)
+
+    def records(self):
+        '''
+        Yields raw (timestamp, class index, file size) records
+        '''
+        if self.format == 'csv':
+            with open(self.filename, 'r', newline='', buffering=1 << 20) as file:
+                for row in csv.reader(file):
+                    if not row or row[0].startswith('#'):
+                        continue
+                    try:
+                        timestamp = float(row[0])
+                    except ValueError:  # header
+                        continue
+                    yield timestamp, self.class_index(row[1].strip()), float(row[2])
+        else:
+            trace = np.memmap(self.filename, dtype=TRACE_DTYPE, mode='r')
+            class_indexes = [self.class_index(code) for code in range(len(self.types))]
+            for start in range(0, len(trace), self.chunk_size):
+                chunk = trace[start:start + self.chunk_size]
+                for timestamp, code, file_size in zip(chunk['time'].tolist(), chunk['class'].tolist(), chunk['file_size'].tolist()):
+                    yield timestamp, class_indexes[code] if code < len(class_indexes) else code, file_size
+
+    def __iter__(self):
+        first = None
+        previous = None
+        for timestamp, class_index, file_size in self.records():
+            if first is None:
+                first = timestamp
+            if previous is not None and timestamp < previous:
+                raise ValueError(f'Trace {self.filename} is not sorted by time ({timestamp} after {previous})')
+            previous = timestamp
+            yield (timestamp - first) * self.time_scale, class_index, file_size
+
+
+def convert_csv_trace(csv_filename: str, binary_filename: str, class_map: dict | None = None, chunk_size: int = 65536, types: tuple = USER_TYPES) -> int:
+    '''
+    Converts csv trace into binary one (class stored as user class code), returns number of records
+    '''
+    source = TraceArrivals(csv_filename, 'csv', class_map=class_map, types=types)
+    buffer = np.empty(chunk_size, dtype=TRACE_DTYPE)
+    count = 0
+    filled = 0
+    with open(binary_filename, 'wb') as file:
+        for timestamp, class_index, file_size in source.records():
+            buffer[filled] = (timestamp, class_index, file_size)
+            filled += 1
+            if filled == chunk_size:
+                file.write(buffer.tobytes())
+                count += filled
+                filled = 0
+        file.write(buffer[:filled].tobytes())
+    return count + filled
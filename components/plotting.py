@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def figure_width_px(fig) -> int:
+    return int(fig.get_figwidth() * fig.dpi)
+
+
+def downsample_steps(times, values, end_time: float, width: int):
+    '''
+    Reduces step series (values[i] holds from times[i] until times[i + 1]) to at most width steps.
+    Every step keeps the maximum within its pixel, so the filled plot looks the same.
+    '''
+    times = np.asarray(times)
+    values = np.asarray(values)
+    if len(times) <= width:
+        return times, values
+    edges = np.linspace(times[0], end_time, width + 1)[:-1]
+    in_effect = np.searchsorted(times, edges, side='right') - 1  # step in effect at the beginning of every pixel
+    downsampled = values[in_effect].copy()
+    pixels = np.searchsorted(edges, times, side='right') - 1
+    np.maximum.at(downsampled, pixels, values)
+    return edges, downsampled
+
+
+def class_histograms(values, class_codes, classes_number: int, bins: int):
+    '''
+    Histograms of values per class (rows 0..classes_number - 1) and of all values (last row)
+    on common bin edges, counted by a single bincount
+    '''
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.zeros((classes_number + 1, bins), dtype=int), np.linspace(0, 1, bins + 1)
+    edges = np.histogram_bin_edges(values, bins=bins)
+    indexes = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1)
+    counts = np.bincount(np.asarray(class_codes, dtype=np.int64) * bins + indexes, minlength=classes_number * bins)
+    counts = counts[:classes_number * bins].reshape(classes_number, bins)
+    return np.vstack((counts, counts.sum(axis=0))), edges
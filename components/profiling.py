@@ -0,0 +1,98 @@
+from collections import defaultdict
+from time import perf_counter
+
+import simpy
+
+from .recorder import Columns
+
+
+class Profiler:
+    '''
+    Opt-in instrumentation of station visits and user flows. Attaching replaces the generator methods
+    of given objects with timed wrappers, nothing is wrapped (and nothing costs) when profiler is not attached.
+
+    Collected per call path (user type, flow, station):
+        visits, events yielded to the kernel, wall-clock time spent inside the generator (exclusive of nested ones)
+    and sampled over simulated time: size of simpy event queue and simulated seconds per wall-clock second
+    '''
+
+    def __init__(self, env: simpy.Environment, sample_interval: float = 10) -> None:
+        self.env = env
+        self.sample_interval = sample_interval
+        self.visits = defaultdict(int)
+        self.events = defaultdict(int)
+        self.self_time = defaultdict(float)
+        self.samples = Columns(time='d', wall_time='d', event_queue='q')
+        self._stack = []
+        self._children_time = []
+        self._counted_event = None
+
+    def instrument(self, obj, method_name: str, name: str) -> None:
+        '''
+        Wraps generator method obj.method_name(user, *args), its frames are named by name
+        '''
+        method = getattr(obj, method_name)
+
+        def profiled(user, *args):
+            return self._profiled(method(user, *args), name, user.type)
+        setattr(obj, method_name, profiled)
+
+    def _profiled(self, generator, name: str, user_type: str):
+        # body starts on the first send, within the resumption of the calling (parent) generator
+        path = self._stack[-1] + (name,) if self._stack else (user_type, name)
+        self.visits[path] += 1
+        value, exception = None, None
+        while True:
+            self._stack.append(path)
+            self._children_time.append(0.0)
+            start = perf_counter()
+            try:
+                event = generator.send(value) if exception is None else generator.throw(exception)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                elapsed = perf_counter() - start
+                self._stack.pop()
+                self.self_time[path] += elapsed - self._children_time.pop()
+                if self._children_time:
+                    self._children_time[-1] += elapsed
+            if event is not self._counted_event:  # the same event passes through every enclosing frame
+                self.events[path] += 1
+                self._counted_event = event
+            try:
+                value, exception = (yield event), None
+            except BaseException as e:
+                value, exception = None, e
+
+    def sample(self):
+        while True:
+            self.samples.append(self.env.now, perf_counter(), len(self.env._queue))  # simpy has no public queue size
+            yield self.env.timeout(self.sample_interval)
+
+    def table(self) -> list:
+        '''
+        Rows (path, visits, events, wall time in ms) sorted by wall time
+        '''
+        rows = [
+            (';'.join(path), self.visits[path], self.events[path], self.self_time[path] * 1000)
+            for path in self.self_time
+        ]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def print_table(self) -> None:
+        print(f"{'path':<40} {'visits':>10} {'events':>10} {'wall [ms]':>12} {'per event [us]':>15}")
+        for path, visits, events, wall_time in self.table():
+            per_event = wall_time * 1000 / events if events else 0
+            print(f'{path:<40} {visits:>10} {events:>10} {wall_time:>12.1f} {per_event:>15.2f}')
+        time, wall_time, event_queue = self.samples['time'], self.samples['wall_time'], self.samples['event_queue']
+        if len(time) > 1:
+            print(f'simulated seconds per wall-clock second: {(time[-1] - time[0]) / (wall_time[-1] - wall_time[0]):.1f}')
+            print(f'event queue size: mean {event_queue.mean():.1f}, max {event_queue.max()}')
+
+    def write_collapsed(self, filename: str) -> None:
+        '''
+        Collapsed stacks (flamegraph.pl / speedscope input), weight is exclusive wall time in microseconds
+        '''
+        with open(filename, 'w') as file:
+            for path, self_time in self.self_time.items():
+                file.write(f"{';'.join(path)} {round(self_time * 1e6)}\n")
@@ -0,0 +1,162 @@
+import json
+import os
+from collections import deque
+from time import perf_counter
+
+import numpy as np
+import simpy
+
+
+class CountingEnvironment(simpy.Environment):
+    '''
+    Environment counting processed kernel events
+    '''
+
+    def __init__(self, initial_time=0) -> None:
+        super().__init__(initial_time)
+        self.processed_events = 0
+
+    def step(self) -> None:
+        self.processed_events += 1
+        super().step()
+
+
+def run_in_slices(env: simpy.Environment, until: float, checks: list) -> bool:
+    '''
+    Advances env up to until, checks: list of (interval, callback), callback is called every interval
+    of simulated time and returning True stops the run. Returns True when stopped before until.
+    '''
+    next_times = [env.now + interval for interval, _ in checks]
+    while env.now < until:
+        env.run(until=min(next_times + [until]))
+        for i, (interval, callback) in enumerate(checks):
+            if env.now >= next_times[i]:
+                next_times[i] += interval
+                if callback():
+                    return True
+    return False
+
+
+class Progress:
+    '''
+    Wall-clock time and kernel event rate between consecutive snapshots,
+    events are known only with CountingEnvironment
+    '''
+
+    def __init__(self, env: simpy.Environment) -> None:
+        self.env = env
+        self.start = perf_counter()
+        self.last_wall_time = self.start
+        self.last_time = env.now
+        self.last_events = getattr(env, 'processed_events', None)
+
+    def rates(self) -> dict:
+        wall_time = perf_counter()
+        elapsed = max(wall_time - self.last_wall_time, 1e-9)
+        events = getattr(self.env, 'processed_events', None)
+        rates = {
+            'wall_time': wall_time - self.start,
+            'events': events,
+            'events_per_second': (events - self.last_events) / elapsed if events is not None else None,
+            'simulated_seconds_per_second': (self.env.now - self.last_time) / elapsed,
+        }
+        self.last_wall_time, self.last_time, self.last_events = wall_time, self.env.now, events
+        return rates
+
+
+def flatten(snapshot: dict, prefix: str = '') -> dict:
+    '''
+    {'stations': {'FIFO': {'queue_length': 3}}} -> {'stations.FIFO.queue_length': 3}
+    '''
+    flat = {}
+    for key, value in snapshot.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+class SnapshotWriter:
+    '''
+    Observer saving snapshots, never aborts the run:
+        .jsonl - one snapshot per line, flushed at once (tail -f friendly), when the file exceeds max_bytes
+                 it is rotated to filename.1, ..., filename.<backups>
+        .npz   - columns of the last history snapshots, replaced atomically after every snapshot
+    '''
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 2**20, backups: int = 3, history: int = 1000) -> None:
+        self.filename = filename
+        self.is_npz = filename.endswith('.npz')
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.snapshots = deque(maxlen=history)
+        self.file = None if self.is_npz else open(filename, 'a')
+
+    def __call__(self, snapshot: dict) -> bool:
+        if self.is_npz:
+            self.snapshots.append(flatten(snapshot))
+            self.write_npz()
+        else:
+            self.file.write(json.dumps(snapshot) + '\n')
+            self.file.flush()
+            if self.file.tell() > self.max_bytes:
+                self.rotate()
+        return False
+
+    def rotate(self) -> None:
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.filename}.{i}'):
+                os.replace(f'{self.filename}.{i}', f'{self.filename}.{i + 1}')
+        if self.backups:
+            os.replace(self.filename, f'{self.filename}.1')
+        else:
+            os.remove(self.filename)
+        self.file = open(self.filename, 'a')
+
+    def write_npz(self) -> None:
+        keys = dict.fromkeys(key for snapshot in self.snapshots for key in snapshot)
+        arrays = {
+            key: np.array([np.nan if snapshot.get(key) is None else snapshot[key] for snapshot in self.snapshots], dtype=float)
+            for key in keys
+        }
+        temporary = self.filename[:-len('.npz')] + '.tmp.npz'
+        np.savez(temporary, **arrays)
+        os.replace(temporary, self.filename)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class DivergenceGuard:
+    '''
+    Observer aborting the run when queue length of some station grew in each of the last window snapshots
+    and reached min_queue_length, i.e. the station is clearly overloaded
+    '''
+
+    def __init__(self, window: int = 10, min_queue_length: int = 100) -> None:
+        self.window = window
+        self.min_queue_length = min_queue_length
+        self.history = {}
+        self.diverging = None  # name of the station that caused abort
+
+    def __call__(self, snapshot: dict) -> bool:
+        for station, state in snapshot['stations'].items():
+            history = self.history.setdefault(station, deque(maxlen=self.window + 1))
+            history.append(state['queue_length'])
+            if (len(history) == history.maxlen and history[-1] >= self.min_queue_length
+                    and all(a < b for a, b in zip(history, list(history)[1:]))):
+                self.diverging = station
+                return True
+        return False
+
+
+def combine(*observers):
+    '''
+    Single observer calling every given one, aborts when any of them does
+    '''
+    def observer(snapshot: dict) -> bool:
+        return any([each(snapshot) for each in observers])  # list, so every observer sees the snapshot
+    return observer
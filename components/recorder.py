@@ -0,0 +1,87 @@
+from array import array
+
+import numpy as np
+
+
+class Columns:
+    '''
+    Columnar event log, every column is a growable typed array.
+    Appending a row doesn't allocate a tuple nor take a lock,
+    columns are read as numpy arrays (copied, so the log can keep growing).
+    '''
+
+    def __init__(self, **typecodes: str) -> None:
+        '''
+        typecodes: column name -> array typecode, e.g. time='d', user_id='q'
+        '''
+        self.typecodes = typecodes
+        self.columns = {name: array(typecode) for name, typecode in typecodes.items()}
+        self._appends = tuple(column.append for column in self.columns.values())
+
+    def append(self, *row) -> None:
+        for append, value in zip(self._appends, row):
+            append(value)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return np.array(self.columns[name])
+
+    def as_dict(self) -> dict:
+        return {name: self[name] for name in self.columns}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+
+class UserTimes:
+    '''
+    CSR layout of users' visits: flat enter and out times, visits of i-th user are [offsets[i]:offsets[i + 1]].
+    Users still in the system get end_time as the out time of their last visit.
+    '''
+
+    def __init__(self, users, end_time: float) -> None:
+        enter_time, out_time = array('d'), array('d')
+        counts = array('q')
+        class_codes = array('b')
+        for user in users:
+            enter_time.extend(user.enter_time)
+            out_time.extend(user.out_time)
+            if len(user.out_time) < len(user.enter_time):
+                out_time.append(end_time)
+            counts.append(len(user.enter_time))
+            class_codes.append(user.code)
+        self.enter_time = np.array(enter_time)
+        self.out_time = np.array(out_time)
+        self.class_codes = np.array(class_codes)
+        self.offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+    def __len__(self) -> int:
+        return len(self.class_codes)
+
+    def per_user_sum(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Sum of per-visit values for every user (users without visits get 0)
+        '''
+        sums = np.zeros(len(self))
+        visited = self.offsets[1:] > self.offsets[:-1]
+        if visited.any():
+            sums[visited] = np.add.reduceat(values, self.offsets[:-1][visited])
+        return sums
+
+    def times_in_visits(self) -> np.ndarray:
+        return self.per_user_sum(self.out_time - self.enter_time)
+
+    def times_in_system(self) -> np.ndarray:
+        '''
+        From the first enter to the last out
+        '''
+        visited = self.offsets[1:] > self.offsets[:-1]
+        times = np.zeros(len(self))
+        times[visited] = self.out_time[self.offsets[1:][visited] - 1] - self.enter_time[self.offsets[:-1][visited]]
+        return times
@@ -0,0 +1,297 @@
+import json
+import math
+from array import array
+
+import numpy as np
+from scipy import stats
+
+
+class RunningStats:
+    '''
+    O(1) memory accumulator of count, mean, variance, min and max (Welford's algorithm)
+    '''
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        merged = RunningStats()
+        merged.count = self.count + other.count
+        if merged.count:
+            delta = other.mean - self.mean
+            merged.mean = self.mean + delta * other.count / merged.count
+            merged.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / merged.count
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        return merged
+
+    @staticmethod
+    def grouped(values, groups, groups_number: int) -> list:
+        '''
+        Accumulators of values split by integer group (e.g. user class code), computed by bincount
+        '''
+        values = np.asarray(values, dtype=float)
+        groups = np.asarray(groups, dtype=np.int64)
+        counts = np.bincount(groups, minlength=groups_number)
+        sums = np.bincount(groups, weights=values, minlength=groups_number)
+        means = np.divide(sums, counts, out=np.zeros(groups_number), where=counts > 0)
+        m2 = np.bincount(groups, weights=(values - means[groups]) ** 2, minlength=groups_number)
+        minimums = np.full(groups_number, math.inf)
+        maximums = np.full(groups_number, -math.inf)
+        np.minimum.at(minimums, groups, values)
+        np.maximum.at(maximums, groups, values)
+        accumulators = []
+        for group in range(groups_number):
+            running_stats = RunningStats()
+            running_stats.count = int(counts[group])
+            running_stats.mean = float(means[group])
+            running_stats.m2 = float(m2[group])
+            running_stats.min = float(minimums[group])
+            running_stats.max = float(maximums[group])
+            accumulators.append(running_stats)
+        return accumulators
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else math.nan,
+            'variance': self.variance,
+            'min': self.min if self.count else math.nan,
+            'max': self.max if self.count else math.nan,
+        }
+
+
+class LogHistogram:
+    '''
+    HDR-style log-linear histogram of non-negative values (e.g. times in seconds): every power of two
+    between lowest and highest is split into sub_buckets equal buckets, so relative error of
+    reported percentiles is below 1 / sub_buckets. Recording is O(1), memory is fixed
+    and histograms of the same layout merge losslessly. Zeros are counted apart,
+    values outside [lowest, highest] fall into the first or the last bucket (min and max stay exact).
+    '''
+
+    __slots__ = ('lowest', 'highest', 'sub_buckets', 'min_exponent', 'counts', 'zeros', 'count', 'total', 'min', 'max')
+
+    def __init__(self, lowest: float = 1e-4, highest: float = 1e6, sub_buckets: int = 128) -> None:
+        self.lowest = lowest
+        self.highest = highest
+        self.sub_buckets = sub_buckets
+        self.min_exponent = math.frexp(lowest)[1]
+        self.counts = array('q', bytes(8 * (math.frexp(highest)[1] - self.min_exponent + 1) * sub_buckets))
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def index(self, value: float) -> int:
+        mantissa, exponent = math.frexp(value)
+        index = (exponent - self.min_exponent) * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+        return min(max(index, 0), len(self.counts) - 1)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.counts[self.index(value)] += 1
+
+    def add_many(self, values) -> None:
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        positive = values[values > 0]
+        mantissas, exponents = np.frexp(positive)
+        indexes = (exponents - self.min_exponent) * self.sub_buckets + ((mantissas - 0.5) * 2 * self.sub_buckets).astype(np.int64)
+        counts = np.bincount(np.clip(indexes, 0, len(self.counts) - 1), minlength=len(self.counts))
+        self.counts = array('q', (np.frombuffer(self.counts, dtype=np.int64) + counts).tobytes())
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def layout(self) -> tuple:
+        return self.lowest, self.highest, self.sub_buckets
+
+    def merge(self, other: 'LogHistogram') -> 'LogHistogram':
+        if self.layout() != other.layout():
+            raise ValueError(f'Cannot merge histograms of different layouts: {self.layout()} and {other.layout()}')
+        merged = LogHistogram(*self.layout())
+        merged.counts = array('q', (np.frombuffer(self.counts, dtype=np.int64) + np.frombuffer(other.counts, dtype=np.int64)).tobytes())
+        merged.zeros = self.zeros + other.zeros
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        return merged
+
+    def bucket_value(self, index: int) -> float:
+        '''
+        Middle of the bucket
+        '''
+        exponent, sub_bucket = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub_bucket + 0.5) / (2 * self.sub_buckets), exponent + self.min_exponent)
+
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return math.nan
+        rank = max(math.ceil(percentile / 100 * self.count), 1)
+        if rank <= self.zeros:
+            return 0.0
+        cumulative = np.cumsum(np.frombuffer(self.counts, dtype=np.int64)) + self.zeros
+        index = int(np.searchsorted(cumulative, rank))
+        return min(max(self.bucket_value(index), self.min), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def as_dict(self, percentiles=(50, 95, 99)) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min if self.count else math.nan,
+            'max': self.max if self.count else math.nan,
+            **{f'p{percentile}': self.percentile(percentile) for percentile in percentiles},
+        }
+
+    def to_dict(self) -> dict:
+        '''
+        JSON serializable form, buckets are stored sparse
+        '''
+        counts = np.frombuffer(self.counts, dtype=np.int64)
+        indexes = np.flatnonzero(counts)
+        return {
+            'lowest': self.lowest, 'highest': self.highest, 'sub_buckets': self.sub_buckets,
+            'indexes': indexes.tolist(), 'counts': counts[indexes].tolist(),
+            'zeros': self.zeros, 'count': self.count, 'total': self.total,
+            'min': self.min if self.count else None, 'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LogHistogram':
+        histogram = cls(data['lowest'], data['highest'], data['sub_buckets'])
+        for index, count in zip(data['indexes'], data['counts']):
+            histogram.counts[index] = count
+        histogram.zeros = data['zeros']
+        histogram.count = data['count']
+        histogram.total = data['total']
+        if data['count']:
+            histogram.min, histogram.max = data['min'], data['max']
+        return histogram
+
+
+def save_histograms(histograms: dict, filename: str) -> None:
+    with open(filename, 'w') as file:
+        json.dump({name: histogram.to_dict() for name, histogram in histograms.items()}, file)
+
+
+def load_histograms(filename: str) -> dict:
+    with open(filename, 'r') as file:
+        return {name: LogHistogram.from_dict(data) for name, data in json.load(file).items()}
+
+
+def merge_histograms(histograms_list) -> dict:
+    '''
+    Merges dicts {name: LogHistogram} (e.g. from replications) name by name
+    '''
+    merged = {}
+    for histograms in histograms_list:
+        for name, histogram in histograms.items():
+            merged[name] = merged[name].merge(histogram) if name in merged else histogram
+    return merged
+
+
+class TimeWeightedStats:
+    '''
+    O(1) memory accumulator of piecewise constant signal (e.g. queue length),
+    value set at given time holds until the next update
+    '''
+
+    __slots__ = ('start_time', 'last_time', 'last_value', 'area', 'min', 'max')
+
+    def __init__(self, start_time: float = 0.0, value: float = 0) -> None:
+        self.start_time = start_time
+        self.last_time = start_time
+        self.last_value = value
+        self.area = 0.0
+        self.min = value
+        self.max = value
+
+    def update(self, time: float, value: float) -> None:
+        self.area += self.last_value * (time - self.last_time)
+        self.last_time = time
+        self.last_value = value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self, end_time: float) -> float:
+        duration = end_time - self.start_time
+        if duration <= 0:
+            return math.nan
+        return (self.area + self.last_value * (end_time - self.last_time)) / duration
+
+    def as_dict(self, end_time: float) -> dict:
+        return {
+            'mean': self.mean(end_time),
+            'min': self.min,
+            'max': self.max,
+        }
+
+
+def mser5(series) -> int:
+    '''
+    Warm-up length by MSER-5: number of initial observations to delete,
+    minimizing standard error of the mean of batch means of size 5 (searched over first half only)
+    '''
+    series = np.asarray(series, dtype=float)
+    batches_number = len(series) // 5
+    if batches_number < 2:
+        return 0
+    batches = series[:batches_number * 5].reshape(batches_number, 5).mean(axis=1)
+    remaining = batches_number - np.arange(batches_number)
+    sums = np.cumsum(batches[::-1])[::-1]
+    squares = np.cumsum((batches ** 2)[::-1])[::-1]
+    mser = (squares - sums ** 2 / remaining) / remaining ** 2
+    return int(np.argmin(mser[:batches_number // 2 + 1])) * 5
+
+
+def batch_means(series, batches: int = 20, confidence: float = 0.95):
+    '''
+    Returns (mean, half width) of t-based confidence interval from non-overlapping batch means
+    '''
+    series = np.asarray(series, dtype=float)
+    batch_size = len(series) // batches
+    if batch_size == 0:
+        return math.nan, math.inf
+    means = series[:batch_size * batches].reshape(batches, batch_size).mean(axis=1)
+    half_width = stats.t.ppf((1 + confidence) / 2, batches - 1) * np.std(means, ddof=1) / math.sqrt(batches)
+    return float(np.mean(means)), float(half_width)
@@ -0,0 +1,61 @@
+import math
+from array import array
+
+from .statistics import batch_means, mser5
+
+
+class SequentialStopping:
+    '''
+    Collects observations of chosen metrics during the run and decides when to stop:
+    warm-up is removed by MSER-5 and the rest is split into batch means,
+    the run is long enough when relative CI half-width of every metric is below the target.
+
+    Metrics are named '<kind>.<name>':
+        response.<user type>, response_without_segmented.<user type> - observed on every completed user
+        queue_length.<station>, in_service.<station> - sampled every observation_interval
+    '''
+
+    def __init__(self, config: dict) -> None:
+        self.metrics = config['metrics']
+        self.relative_precision = config.get('relative_precision', 0.05)
+        self.confidence = config.get('confidence', 0.95)
+        self.check_interval = config.get('check_interval', 60)
+        self.observation_interval = config.get('observation_interval', 5)
+        self.batches = config.get('batches', 20)
+        self.series = {metric: array('d') for metric in self.metrics}
+
+    def observe(self, metric: str, value: float) -> None:
+        if metric in self.series:
+            self.series[metric].append(value)
+
+    def station_metrics(self):
+        '''
+        Yields (metric, kind, station name) of metrics sampled from stations
+        '''
+        for metric in self.metrics:
+            kind, name = metric.split('.', 1)
+            if kind in ('queue_length', 'in_service'):
+                yield metric, kind, name
+
+    def estimate(self, metric: str) -> dict:
+        series = self.series[metric]
+        warmup = mser5(series)
+        mean, half_width = batch_means(series[warmup:], self.batches, self.confidence)
+        if len(series) - warmup < 5 * self.batches:
+            half_width = math.inf
+        return {
+            'mean': mean,
+            'half_width': half_width,
+            'relative_half_width': half_width / abs(mean) if mean else (0.0 if half_width == 0 else math.inf),
+            'warmup': warmup,
+            'observations': len(series),
+        }
+
+    def is_precise(self) -> bool:
+        return all(
+            self.estimate(metric)['relative_half_width'] <= self.relative_precision
+            for metric in self.metrics
+        )
+
+    def report(self) -> dict:
+        return {metric: self.estimate(metric) for metric in self.metrics}
@@ -6,26 +6,28 @@ from ..users import User
 
 
 class FIFO_segmented(Resource):
-    def __init__(self, env: simpy.Environment, config: dict):
-        super().__init__(env, config)
+    def __init__(self, env: simpy.Environment, config: dict, **kwargs):
+        super().__init__(env, config, **kwargs)
         self.segment_size = self.config['segment_size']
     
-    def process(self, user: User, time):
-        def _process_logic():
-            enter_time = self.env.now
-            self.track_queue_length_and_service(enter_time, user)
+    def visit(self, user: User, time):
+        if self.discipline != 'fcfs':
+            yield from self.serve(user, time)
+            return
+        enter_time = self.env.now
+        self.track_queue_length_and_service(enter_time, user)
 
-            with self.resource.request() as request:
-                yield request
-                process_time = self.env.now
-                self.track_queue_length_and_service(process_time, user)
+        with self.resource.request() as request:
+            self.track_state(enter_time)
+            yield request
+            process_time = self.env.now
+            self.track_state(process_time)
+            self.track_queue_length_and_service(process_time, user)
                 
-                yield self.env.timeout(time)
-                out_time = self.env.now
-                self.track_queue_length_and_service(out_time, user)
-            
-            self.time_in_queue(user, process_time, enter_time)
-            self.time_in_service(user, out_time, process_time)
-            self.time_in_system(user, out_time, enter_time)
-        return self.env.process(_process_logic())
+            yield self.env.timeout(time)
+            out_time = self.env.now
+            self.track_queue_length_and_service(out_time, user)
+        self.track_state(out_time)
+
+        self.register_visit(user, enter_time, process_time, out_time)
         
\ No newline at end of file
@@ -6,26 +6,28 @@ from ..users import User
 
 
 class FIFO_sequential(Resource):
-    def __init__(self, env: simpy.Environment, config: dict):
-        super().__init__(env, config)
+    def __init__(self, env: simpy.Environment, config: dict, **kwargs):
+        super().__init__(env, config, **kwargs)
         self.time = self.config['time']
         self.number_of_channels = self.config['number_of_channels']
     
-    def process(self, user: User):
-        def _process_logic():
-            enter_time = self.env.now
-            self.track_queue_length_and_service(enter_time, user)
+    def visit(self, user: User):
+        if self.discipline != 'fcfs':
+            yield from self.serve(user, self.time)
+            return
+        enter_time = self.env.now
+        self.track_queue_length_and_service(enter_time, user)
 
-            with self.resource.request() as request:
-                yield request
-                process_time = self.env.now
-                self.track_queue_length_and_service(process_time, user)
+        with self.resource.request() as request:
+            self.track_state(enter_time)
+            yield request
+            process_time = self.env.now
+            self.track_state(process_time)
+            self.track_queue_length_and_service(process_time, user)
                 
-                yield self.env.timeout(self.time)
-                out_time = self.env.now
-                self.track_queue_length_and_service(out_time, user)
-                
-            self.time_in_queue(user, process_time, enter_time)
-            self.time_in_service(user, out_time, process_time)
-            self.time_in_system(user, out_time, enter_time)
-        return self.env.process(_process_logic())
\ No newline at end of file
+            yield self.env.timeout(self.time)
+            out_time = self.env.now
+            self.track_queue_length_and_service(out_time, user)
+        self.track_state(out_time)
+
+        self.register_visit(user, enter_time, process_time, out_time)
\ No newline at end of file
@@ -1,28 +1,25 @@
 import simpy
 
-from . import Resource
+from . import Delay
 from ..users import User
 
 
-class IS(Resource):
-    def __init__(self, env: simpy.Environment, config: dict):
-        super().__init__(env, config)
+class IS(Delay):
+    def __init__(self, env: simpy.Environment, config: dict, **kwargs):
+        super().__init__(env, config, **kwargs)
         self.time = self.config['time']
     
-    def process(self, user: User):
-        def _process_logic():
-            enter_time = self.env.now
-            self.track_queue_length_and_service(enter_time, user)
+    def visit(self, user: User):
+        enter_time = self.env.now
+        self.track_queue_length_and_service(enter_time, user)
+        self.in_service += 1
+        self.track_state(enter_time)
+        self.track_queue_length_and_service(enter_time, user)
 
-            with self.resource.request() as request:
-                yield request
-                process_time = self.env.now
-                self.track_queue_length_and_service(process_time, user)
-                yield self.env.timeout(self.time)
-                out_time = self.env.now
-                self.track_queue_length_and_service(out_time, user)
+        yield self.env.timeout(self.time)
+        out_time = self.env.now
+        self.track_queue_length_and_service(out_time, user)
+        self.in_service -= 1
+        self.track_state(out_time)
 
-            self.time_in_queue(user, process_time, enter_time)
-            self.time_in_service(user, out_time, process_time)
-            self.time_in_system(user, out_time, enter_time)
-        return self.env.process(_process_logic())
\ No newline at end of file
+        self.register_visit(user, enter_time, enter_time, out_time)
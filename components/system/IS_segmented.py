@@ -1,33 +1,91 @@
+from collections import defaultdict
+
 import simpy
 
-from . import Resource
+from . import Delay
+from .prefetch import Playback, create_policy
+from ..recorder import Columns
+from ..statistics import RunningStats
 from ..users import User
 
 
-class IS_segmented(Resource):
-    def __init__(self, env: simpy.Environment, config: dict):
-        super().__init__(env, config)
+class IS_segmented(Delay):
+    '''
+    User watches downloaded segments here, the visit lasts until the next segment is requested,
+    as decided by prefetch policy (see prefetch.PREFETCH_POLICIES).
+    Playback of every user is followed to count stalls: times when no downloaded segment was left to watch.
+    '''
+
+    def __init__(self, env: simpy.Environment, config: dict, **kwargs):
+        super().__init__(env, config, **kwargs)
         self.segment_watchtime = self.config['segment_watchtime']
-        self.earlier_download = self.config['earlier_download']
-        self.users_time = {}
-
-    def process(self, user: User):
-        def _process_logic():
-            enter_time = self.env.now
-            self.track_queue_length_and_service(enter_time, user)
-            time_to_wait = self.segment_watchtime - min(enter_time - self.users_time.get(user.id, enter_time), self.earlier_download)
-            
-            with self.resource.request() as request:
-                yield request
-                process_time = self.env.now
-                self.track_queue_length_and_service(process_time, user)
-                
-                yield self.env.timeout(time_to_wait)
-                out_time = self.env.now
-                self.track_queue_length_and_service(out_time, user)
-                self.users_time[user.id] = out_time
-
-            self.time_in_queue(user, process_time, enter_time)
-            self.time_in_service(user, out_time, process_time)
-            self.time_in_system(user, out_time, enter_time)
-        return self.env.process(_process_logic())
\ No newline at end of file
+        self.smoothing = self.config.get('smoothing', 0.3)  # weight of the last fetch time in its running estimate
+        self.policy = create_policy(self.config)
+        self.playbacks = {}  # user -> Playback (ids are unique only within a class)
+        # per user stalls of completed users
+        self.stall_log = Columns(user_id='q', class_code='b', stalls='l', stall_time='d')
+        self.stall_stats = {'stalls': defaultdict(RunningStats), 'stall_time': defaultdict(RunningStats)}
+
+    def connect(self, stations: dict) -> None:
+        '''
+        Gives policy access to other stations by name, called once all stations are built
+        '''
+        if hasattr(self.policy, 'connect'):
+            self.policy.connect(stations)
+
+    def arrive(self, user: User, time: float) -> Playback:
+        '''
+        Segment downloaded in the last visits of user is added to its playback
+        '''
+        playback = self.playbacks.get(user)
+        if playback is None:
+            playback = self.playbacks[user] = Playback()
+        playback.arrive(time, time - user.enter_time[-1], self.segment_watchtime, self.smoothing)
+        return playback
+
+    def visit(self, user: User):
+        enter_time = self.env.now
+        self.track_queue_length_and_service(enter_time, user)
+        playback = self.arrive(user, enter_time)
+        time_to_wait = self.policy.delay(playback, enter_time)
+        self.in_service += 1
+        self.track_state(enter_time)
+        self.track_queue_length_and_service(enter_time, user)
+
+        yield self.env.timeout(time_to_wait)
+        out_time = self.env.now
+        self.track_queue_length_and_service(out_time, user)
+        self.in_service -= 1
+        self.track_state(out_time)
+        playback.last_request = out_time
+
+        self.register_visit(user, enter_time, enter_time, out_time)
+
+    def release(self, user: User):
+        '''
+        Records stalls of user which downloaded the whole file (including the last segment) and forgets it
+        '''
+        playback = self.arrive(user, self.env.now)
+        del self.playbacks[user]
+        if self.trace:
+            self.stall_log.append(user.id, user.code, playback.stalls, playback.stall_time)
+        self.stall_stats['stalls'][user.type].add(playback.stalls)
+        self.stall_stats['stall_time'][user.type].add(playback.stall_time)
+
+    def stall_statistics(self, end_time: float) -> dict:
+        '''
+        Per class stall count and stall time: completed - users which downloaded the whole file,
+        in_progress - users still watching at end_time (stalls so far), all - both merged
+        '''
+        in_progress = {'stalls': defaultdict(RunningStats), 'stall_time': defaultdict(RunningStats)}
+        for user, playback in self.playbacks.items():
+            stalls, stall_time = playback.stalls_until(end_time)
+            in_progress['stalls'][user.type].add(stalls)
+            in_progress['stall_time'][user.type].add(stall_time)
+        statistics = {'completed': self.stall_stats, 'in_progress': in_progress, 'all': {}}
+        for metric in self.stall_stats:
+            statistics['all'][metric] = {
+                type: self.stall_stats[metric][type].merge(in_progress[metric][type])
+                for type in self.types
+            }
+        return statistics
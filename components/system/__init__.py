@@ -1,39 +1,196 @@
-from abc import ABC
-from queue import Queue
+from abc import ABC, abstractmethod
+from collections import defaultdict
 
 import simpy
 
-from ..users import User
+from ..recorder import Columns
+from ..statistics import LogHistogram, RunningStats, TimeWeightedStats
+from ..users import User, USER_TYPES
+from .sharing import SharedServer
+
+
+DISCIPLINES = ('fcfs', 'priority', 'preemptive', 'processor_sharing')
+DEFAULT_PRIORITIES = {'VIP': 0, 'premium': 1, 'standard': 2}  # lower is served first
 
 
 class Resource(ABC):
 
-    def __init__(self, env: simpy.Environment, config: dict):
+    def __init__(self, env: simpy.Environment, config: dict, trace: bool = True, streaming: bool = False, histograms: bool = False, types: tuple = USER_TYPES):
         '''
-        If number of servers is not specified then create infinite capacity
+        If number of servers is not specified then create infinite capacity.
+        types are user classes, index in tuple is class code.
+        trace keeps every sample, streaming keeps only O(1) memory accumulators per user class,
+        histograms keeps fixed memory latency histograms per user class (for percentiles)
         '''
         self.env = env
-        self.resource = simpy.Resource(env, capacity=config['number_of_channels']) \
-            if 'number_of_channels' in config \
-            else simpy.Resource(env, capacity=10**6)
+        self.discipline = config.get('discipline', 'fcfs')
+        if self.discipline not in DISCIPLINES:
+            raise ValueError(f"Unknown discipline: {self.discipline}, expected one of {', '.join(DISCIPLINES)}")
+        priorities = {**DEFAULT_PRIORITIES, **config.get('priorities', {})}
+        weights = config.get('weights', {})
+        for type, weight in weights.items():
+            if not weight > 0:
+                raise ValueError(f'Weight of {type} has to be positive, got {weight}')
+        lowest_priority = max(priorities.values()) + 1  # of classes without priority
+        self.types = types
+        self.priorities = [priorities.get(type, lowest_priority) for type in types]  # indexed by class code
+        self.weights = [weights.get(type, 1) for type in types]
+        self.resource = self.create_resource(env, config)
         self.config = config
-        self.queue_data = Queue() # amount of users in queue
-        self.in_service_data = Queue() # amount of users in system
-        self.times_in_system = Queue() # time spended in system for single request
-        self.times_in_service = Queue() # time spended in service for single request
-        self.times_in_queue = Queue() # time spended in queue for single request
+        self.trace = trace
+        self.streaming = streaming
+        self.histograms = histograms
+        # amount of users in queue and in service, sampled on every enter, start of service and exit
+        self.samples = Columns(time='d', user_id='q', class_code='b', queue_length='l', in_service='l')
+        # time spended in queue, in service and in system for single request
+        self.visits = Columns(user_id='q', class_code='b', queue='d', service='d', system='d')
+        self.stats = {
+            'system': defaultdict(RunningStats),
+            'service': defaultdict(RunningStats),
+            'queue': defaultdict(RunningStats),
+        }
+        self.latency_histograms = {  # time type -> histogram per user class code, empty without histograms
+            time_type: [LogHistogram() for _ in types] for time_type in ('system', 'service', 'queue')
+        } if histograms else {}
+        self.queue_length_stats = TimeWeightedStats(env.now)
+        self.in_service_stats = TimeWeightedStats(env.now)
     
+    def create_resource(self, env: simpy.Environment, config: dict):
+        capacity = config.get('number_of_channels', 10**6)
+        if self.discipline == 'priority':
+            return simpy.PriorityResource(env, capacity=capacity)
+        if self.discipline == 'preemptive':
+            return simpy.PreemptiveResource(env, capacity=capacity)
+        if self.discipline == 'processor_sharing':
+            return SharedServer(env, capacity)
+        return simpy.Resource(env, capacity=capacity)
+
+    @abstractmethod
+    def visit(self, user: User, *args):
+        '''
+        Single visit of user as a generator, inlined into user's flow with yield from
+        '''
+        raise NotImplementedError
+
+    def process(self, user: User, *args):
+        '''
+        Single visit run as a separate simpy process
+        '''
+        return self.env.process(self.visit(user, *args))
+
+    def serve(self, user: User, time):
+        '''
+        Visit under discipline other than fcfs:
+            priority - queue ordered by class priority, service is never interrupted
+            preemptive - arriving user of higher priority interrupts service of the lowest one, which resumes later
+                         (time in queue is counted until the first start of service)
+            processor_sharing - all users are served at once, sharing channels in proportion to class weights
+        '''
+        enter_time = self.env.now
+        self.track_queue_length_and_service(enter_time, user)
+        if self.discipline == 'processor_sharing':
+            done = self.resource.serve(time, self.weights[user.code])
+            self.track_state(enter_time)
+            self.track_queue_length_and_service(enter_time, user)
+            yield done
+            out_time = self.env.now
+            self.track_state(out_time)
+            self.track_queue_length_and_service(out_time, user)
+            self.register_visit(user, enter_time, enter_time, out_time)
+            return
+
+        priority = self.priorities[user.code]
+        process_time = None
+        remaining = time
+        out_time = None
+        while out_time is None:
+            with self.resource.request(priority=priority) as request:
+                self.track_state(self.env.now)
+                yield request
+                start = self.env.now
+                self.track_state(start)
+                if process_time is None:
+                    process_time = start
+                self.track_queue_length_and_service(start, user)
+                try:
+                    yield self.env.timeout(remaining)
+                except simpy.Interrupt:
+                    remaining -= self.env.now - start
+                    self.track_queue_length_and_service(self.env.now, user)
+                else:
+                    out_time = self.env.now
+                    self.track_queue_length_and_service(out_time, user)
+            self.track_state(self.env.now)
+        self.register_visit(user, enter_time, process_time, out_time)
+
+    def current_state(self):
+        '''
+        Number of users in queue and in service
+        '''
+        return len(self.resource.queue), self.resource.count
+
     def track_queue_length_and_service(self, time, user):
-        queue_length = len(self.resource.queue)
-        in_service = self.resource.count
-        self.queue_data.put((time, user, queue_length))
-        self.in_service_data.put((time, user, in_service))
-    
-    def time_in_system(self, user: User, out_time: float, in_time: float):
-        self.times_in_system.put((out_time - in_time, user))
-    
-    def time_in_queue(self, user: User, out_time: float, in_time: float):
-        self.times_in_queue.put((out_time - in_time, user))
-        
-    def time_in_service(self, user: User, out_time: float, in_time: float):
-        self.times_in_service.put((out_time - in_time, user))
\ No newline at end of file
+        self.register_sample(time, user, *self.current_state())
+
+    def register_sample(self, time, user: User, queue_length: int, in_service: int):
+        if self.trace:
+            self.samples.append(time, user.id, user.code, queue_length, in_service)
+
+    def track_state(self, time):
+        '''
+        Feeds time-weighted queue length and occupancy, called right after every change of state
+        (request enqueued, request granted, resource released), unlike samples which are taken before it.
+        simpy grants a waiting request only when the release event is processed, so grants are tracked by the waiting user
+        '''
+        if self.streaming:
+            queue_length, in_service = self.current_state()
+            self.queue_length_stats.update(time, queue_length)
+            self.in_service_stats.update(time, in_service)
+
+    def register_visit(self, user: User, enter_time: float, process_time: float, out_time: float):
+        time_in_queue = process_time - enter_time
+        time_in_service = out_time - process_time
+        time_in_system = out_time - enter_time
+        if self.trace:
+            self.visits.append(user.id, user.code, time_in_queue, time_in_service, time_in_system)
+        if self.streaming:
+            self.stats['queue'][user.type].add(time_in_queue)
+            self.stats['service'][user.type].add(time_in_service)
+            self.stats['system'][user.type].add(time_in_system)
+        if self.histograms:
+            self.latency_histograms['queue'][user.code].add(time_in_queue)
+            self.latency_histograms['service'][user.code].add(time_in_service)
+            self.latency_histograms['system'][user.code].add(time_in_system)
+
+    def streaming_summary(self, end_time: float) -> dict:
+        '''
+        Per class (and 'all') accumulators of times and time-weighted queue length and occupancy
+        '''
+        summary = {}
+        for time_type, class_stats in self.stats.items():
+            total = RunningStats()
+            summary[time_type] = {}
+            for type, running_stats in class_stats.items():
+                summary[time_type][type] = running_stats.as_dict()
+                total = total.merge(running_stats)
+            summary[time_type]['all'] = total.as_dict()
+        summary['queue_length'] = self.queue_length_stats.as_dict(end_time)
+        summary['in_service'] = self.in_service_stats.as_dict(end_time)
+        return summary
+
+
+class Delay(Resource):
+    '''
+    Pure delay (infinite server) station. Nobody ever waits in queue, so there is no simpy resource
+    to request and release, users in service are counted directly
+    '''
+
+    def __init__(self, env: simpy.Environment, config: dict, **kwargs):
+        super().__init__(env, config, **kwargs)
+        self.in_service = 0
+
+    def create_resource(self, env: simpy.Environment, config: dict):
+        return None
+
+    def current_state(self):
+        return 0, self.in_service
@@ -0,0 +1,119 @@
+class Playback:
+    '''
+    Playback of a single user: every segment plays for watchtime, right after the previous one
+    if it is already downloaded, otherwise playback stalls until it arrives. The first segment starts playback.
+    '''
+
+    __slots__ = ('play_end', 'last_request', 'fetch_time', 'stalls', 'stall_time')
+
+    def __init__(self) -> None:
+        self.play_end = None  # time when downloaded segments are played out
+        self.last_request = None  # time when the last segment was requested (user left IS_segmented)
+        self.fetch_time = None  # smoothed time from request to arrival of segment
+        self.stalls = 0
+        self.stall_time = 0.0
+
+    def arrive(self, time: float, fetch_time: float, watchtime: float, smoothing: float) -> None:
+        if self.play_end is None:
+            self.play_end = time
+        elif time > self.play_end:
+            self.stalls += 1
+            self.stall_time += time - self.play_end
+            self.play_end = time
+        self.play_end += watchtime
+        self.fetch_time = fetch_time if self.fetch_time is None else smoothing * fetch_time + (1 - smoothing) * self.fetch_time
+
+    def stalls_until(self, time: float) -> tuple:
+        '''
+        Stall count and stall time so far, including the stall going on at time
+        '''
+        if self.play_end is not None and time > self.play_end:
+            return self.stalls + 1, self.stall_time + time - self.play_end
+        return self.stalls, self.stall_time
+
+    def buffered(self, time: float) -> float:
+        '''
+        Seconds of downloaded, not yet played segments
+        '''
+        return self.play_end - time
+
+
+class FixedPrefetch:
+    '''
+    Next segment is requested segment_watchtime after the previous request, but the time spent downloading
+    counts as watching only up to earlier_download (the original rule)
+    '''
+
+    def __init__(self, config: dict) -> None:
+        self.watchtime = config['segment_watchtime']
+        self.earlier_download = config['earlier_download']
+
+    def delay(self, playback: Playback, time: float) -> float:
+        last_request = playback.last_request if playback.last_request is not None else time
+        return self.watchtime - min(time - last_request, self.earlier_download)
+
+
+class BufferPrefetch:
+    '''
+    Keeps segments_ahead segments buffered: next segment is requested once the buffer drops to that many
+    '''
+
+    def __init__(self, config: dict) -> None:
+        self.watchtime = config['segment_watchtime']
+        self.segments_ahead = config.get('segments_ahead', 1)
+
+    def depth(self) -> float:
+        return self.segments_ahead
+
+    def delay(self, playback: Playback, time: float) -> float:
+        return max(playback.buffered(time) - self.depth() * self.watchtime, 0.0)
+
+
+class QueueAdaptivePrefetch(BufferPrefetch):
+    '''
+    Buffer prefetch going deeper by the number of users waiting per channel of watched_station
+    (rounds of queue ahead of the request), up to max_segments_ahead
+    '''
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+        self.max_segments_ahead = config.get('max_segments_ahead', 5)
+        self.watched_station = config.get('watched_station', 'FIFO_segmented')
+        self.station = None
+
+    def connect(self, stations: dict) -> None:
+        if self.watched_station not in stations:
+            raise ValueError(f'Unknown station watched by queue_adaptive prefetch: {self.watched_station}')
+        self.station = stations[self.watched_station]
+
+    def depth(self) -> float:
+        queue_length, _ = self.station.current_state()
+        capacity = self.station.resource.capacity if self.station.resource is not None else 1
+        return min(self.segments_ahead + queue_length / capacity, self.max_segments_ahead)
+
+
+class RatePrefetch:
+    '''
+    Requests next segment so that it arrives safety times the user's smoothed fetch time before the buffer runs out
+    '''
+
+    def __init__(self, config: dict) -> None:
+        self.safety = config.get('safety', 1.5)
+
+    def delay(self, playback: Playback, time: float) -> float:
+        return max(playback.buffered(time) - self.safety * playback.fetch_time, 0.0)
+
+
+PREFETCH_POLICIES = {
+    'fixed': FixedPrefetch,
+    'buffer': BufferPrefetch,
+    'queue_adaptive': QueueAdaptivePrefetch,
+    'rate': RatePrefetch,
+}
+
+
+def create_policy(config: dict):
+    name = config.get('prefetch', 'fixed')
+    if name not in PREFETCH_POLICIES:
+        raise ValueError(f"Unknown prefetch policy: {name}, expected one of {', '.join(PREFETCH_POLICIES)}")
+    return PREFETCH_POLICIES[name](config)
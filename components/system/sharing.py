@@ -0,0 +1,70 @@
+import simpy
+
+
+class SharedServer:
+    '''
+    Weighted (discriminatory) processor sharing over capacity channels. Every job in service gets
+    a share of capacity proportional to its weight, but never more than one channel;
+    shares are recomputed on every arrival and departure. Nobody waits in queue.
+    '''
+
+    TOLERANCE = 1e-9  # remaining work treated as done
+
+    def __init__(self, env: simpy.Environment, capacity: int) -> None:
+        self.env = env
+        self.capacity = capacity
+        self.queue = []  # always empty, kept for Resource.current_state
+        self.jobs = {}  # done event -> [remaining work, weight, rate]
+        self.last_update = env.now
+        self.version = 0  # completion timers of older versions are stale
+
+    @property
+    def count(self) -> int:
+        return len(self.jobs)
+
+    def serve(self, work: float, weight: float) -> simpy.Event:
+        '''
+        Returns event triggered when given work (in seconds of a dedicated channel) is done
+        '''
+        self.advance()
+        done = self.env.event()
+        self.jobs[done] = [work, weight, 0.0]
+        self.reschedule()
+        return done
+
+    def advance(self) -> None:
+        elapsed = self.env.now - self.last_update
+        if elapsed:
+            for job in self.jobs.values():
+                job[0] -= job[2] * elapsed
+        self.last_update = self.env.now
+
+    def share(self) -> None:
+        '''
+        Water-filling: the heaviest jobs are capped at one channel first, the rest splits what is left
+        '''
+        capacity = self.capacity
+        total_weight = sum(job[1] for job in self.jobs.values())
+        for job in sorted(self.jobs.values(), key=lambda job: job[1], reverse=True):
+            job[2] = min(1.0, capacity * job[1] / total_weight)
+            capacity -= job[2]
+            total_weight -= job[1]
+
+    def reschedule(self) -> None:
+        self.version += 1
+        if not self.jobs:
+            return
+        self.share()
+        first, delay = min(((done, job[0] / job[2]) for done, job in self.jobs.items()), key=lambda item: item[1])
+        version = self.version
+        self.env.timeout(max(delay, 0)).callbacks.append(lambda _: self.complete(version, first))
+
+    def complete(self, version: int, first: simpy.Event) -> None:
+        if version != self.version:
+            return
+        self.advance()
+        finished = [done for done, job in self.jobs.items() if done is first or job[0] <= self.TOLERANCE]
+        for done in finished:
+            del self.jobs[done]
+            done.succeed()
+        self.reschedule()
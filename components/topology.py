@@ -0,0 +1,138 @@
+import numpy as np
+
+from .system.IS import IS
+from .system.IS_segmented import IS_segmented
+from .system.FIFO import FIFO
+from .system.FIFO_segmented import FIFO_segmented
+from .system.FIFO_sequential import FIFO_sequential
+from .users import USER_TYPES
+from .variates import choice_stream
+
+
+STATION_TYPES = {
+    'IS': IS,
+    'IS_segmented': IS_segmented,
+    'FIFO': FIFO,
+    'FIFO_segmented': FIFO_segmented,
+    'FIFO_sequential': FIFO_sequential,
+}
+DOWNLOAD_STATION_TYPES = ('FIFO', 'FIFO_segmented')  # visit(user, time) gets download time of the file part
+
+
+def default_topology(types: tuple = USER_TYPES) -> dict:
+    '''
+    The original net: every class passes input, sequential server and download server,
+    VIP downloads in segments and watches each of them in IS_segmented before requesting the next one
+    (any other class is routed like standard)
+    '''
+    stations = {
+        'IS_input': {'type': 'IS'},
+        'FIFO_sequential': {'type': 'FIFO_sequential'},
+        'IS_between_servers': {'type': 'IS'},
+        'FIFO': {'type': 'FIFO'},
+        'FIFO_segmented': {'type': 'FIFO_segmented'},
+        'IS_segmented': {'type': 'IS_segmented'},
+        'IS_output': {'type': 'IS'},
+    }
+    route = ['IS_input', 'FIFO_sequential', 'IS_between_servers', 'FIFO', 'IS_output']
+    segmented_route = ['IS_input', 'FIFO_sequential', 'IS_between_servers', 'FIFO_segmented', 'IS_output']
+    return {
+        'stations': stations,
+        'classes': {
+            type: {'route': segmented_route, 'segments': {'between': ['IS_segmented']}} if type == 'VIP' else {'route': route}
+            for type in types
+        },
+    }
+
+
+class Topology:
+    '''
+    Stations and per-class routes compiled into integer station ids.
+
+    Spec (the topology section of config, default_topology(types) when missing):
+        stations: name -> {type: one of STATION_TYPES, parameters of station...},
+                  parameters default to the config section of the same name
+        classes: user type -> {
+            route: list of hops, hop is a station name or {choice: {station name: probability, ...}},
+            segments: {size: MB, between: [station names]} - file is downloaded in parts of size
+                      (default segment_size of a station on route), each but the last followed by between
+        }
+
+    Compiled, indexed by class code (index in types):
+        routes - tuple of hops, station id (>= 0) or -(index of choice + 1)
+        segment_sizes - segment size or None
+        between - tuple of station ids visited between segments
+        releases - station ids forgetting user at the end of flow (stations with release method)
+    '''
+
+    def __init__(self, spec: dict, config: dict, types: tuple = USER_TYPES) -> None:
+        self.user_types = types  # user classes, self.types are types of stations
+        self.names = list(spec['stations'])
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.types = []
+        self.station_configs = []
+        for name, station_spec in spec['stations'].items():
+            type = station_spec.get('type')
+            if type not in STATION_TYPES:
+                raise ValueError(f"Unknown type of station {name}: {type}, expected one of {', '.join(STATION_TYPES)}")
+            self.types.append(type)
+            self.station_configs.append({**config.get(name, {}), **{key: value for key, value in station_spec.items() if key != 'type'}})
+        self.takes_work = [type in DOWNLOAD_STATION_TYPES for type in self.types]
+
+        self.choices = []  # (station ids, probabilities)
+        self.routes, self.segment_sizes, self.between, self.releases = [], [], [], []
+        for type in types:
+            if type not in spec['classes']:
+                raise ValueError(f'Missing route of user class {type}')
+            class_spec = spec['classes'][type]
+            route = tuple(self.compile_hop(hop) for hop in class_spec['route'])
+            self.routes.append(route)
+            segments = class_spec.get('segments')
+            if segments is None:
+                self.segment_sizes.append(None)
+                self.between.append(())
+                self.releases.append(())
+                continue
+            between = tuple(self.station_id(name) for name in segments.get('between', ()))
+            self.segment_sizes.append(segments.get('size') or self.route_segment_size(route))
+            self.between.append(between)
+            self.releases.append(tuple(id for id in between if hasattr(STATION_TYPES[self.types[id]], 'release')))
+
+    def station_id(self, name: str) -> int:
+        if name not in self.ids:
+            raise ValueError(f'Unknown station on route: {name}')
+        return self.ids[name]
+
+    def compile_hop(self, hop) -> int:
+        if isinstance(hop, str):
+            return self.station_id(hop)
+        probabilities = hop['choice']
+        self.choices.append(([self.station_id(name) for name in probabilities], list(probabilities.values())))
+        return -len(self.choices)
+
+    def route_segment_size(self, route: tuple) -> float:
+        for hop in route:
+            for id in (self.choices[-hop - 1][0] if hop < 0 else (hop,)):
+                if 'segment_size' in self.station_configs[id]:
+                    return self.station_configs[id]['segment_size']
+        raise ValueError('Segmented route needs segments.size or a station with segment_size')
+
+    def build_stations(self, env, **recording) -> list:
+        '''
+        Station objects indexed by station id, stations with connect method get all stations by name
+        '''
+        stations = [
+            STATION_TYPES[type](env, station_config, types=self.user_types, **recording)
+            for type, station_config in zip(self.types, self.station_configs)
+        ]
+        by_name = dict(zip(self.names, stations))
+        for station in stations:
+            if hasattr(station, 'connect'):
+                station.connect(by_name)
+        return stations
+
+    def choice_streams(self, rng: np.random.Generator) -> list:
+        '''
+        Per choice hop stream of station ids
+        '''
+        return [(ids, choice_stream(rng, probabilities)) for ids, probabilities in self.choices]
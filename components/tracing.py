@@ -0,0 +1,135 @@
+import os
+from array import array
+
+import numpy as np
+
+
+EVENT_KINDS = ('enter', 'process', 'out')
+ENTER, PROCESS, OUT = range(len(EVENT_KINDS))
+# fixed record layout of trace file, packed little-endian
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('user', '<i8'), ('segment', '<i4'), ('kind', 'u1'), ('station', 'u1')])
+TRACE_LEVELS = ('off', 'binary', 'console')
+
+
+class EventTraceWriter:
+    '''
+    Buffered binary writer of events: fields are appended to typed columns
+    and written as EVENT_DTYPE records every buffer_size events
+    '''
+
+    def __init__(self, filename: str, buffer_size: int = 65536) -> None:
+        self.file = open(filename, 'wb')
+        self.buffer_size = buffer_size
+        self.written = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.times, self.users, self.segments = array('d'), array('q'), array('i')
+        self.kinds, self.stations = array('B'), array('B')
+
+    def write(self, time: float, user: int, segment: int, kind: int, station: int = 0) -> None:
+        self.times.append(time)
+        self.users.append(user)
+        self.segments.append(segment)
+        self.kinds.append(kind)
+        self.stations.append(station)
+        if len(self.times) == self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        records = np.empty(len(self.times), dtype=EVENT_DTYPE)
+        records['time'] = self.times
+        records['user'] = self.users
+        records['segment'] = self.segments
+        records['kind'] = self.kinds
+        records['station'] = self.stations
+        self.file.write(records.tobytes())
+        self.written += len(records)
+        self.reset()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class ConsoleTracer:
+    '''
+    Human readable events on stdout, for debugging of short runs only
+    '''
+
+    MESSAGES = ('przychodzi', 'jest obsługiwany', 'zakończył obsługę')
+
+    def write(self, time: float, user: int, segment: int, kind: int, station: int = 0) -> None:
+        print(f'User {user} {self.MESSAGES[kind]} w czasie {time}, segment {segment + 1}')
+
+    def close(self) -> None:
+        pass
+
+
+def create_tracer(level: str, filename: str | None = None):
+    '''
+    Tracer for given level, None when off (callers skip tracing entirely)
+    '''
+    if level not in TRACE_LEVELS:
+        raise ValueError(f"Unknown trace level: {level}, expected one of {', '.join(TRACE_LEVELS)}")
+    if level == 'binary':
+        return EventTraceWriter(filename)
+    if level == 'console':
+        return ConsoleTracer()
+    return None
+
+
+class EventTrace:
+    '''
+    Memory-mapped trace file written by EventTraceWriter, events are in order of simulation
+    '''
+
+    def __init__(self, filename: str) -> None:
+        # numpy cannot map an empty file
+        self.events = np.memmap(filename, dtype=EVENT_DTYPE, mode='r') if os.path.getsize(filename) else np.empty(0, dtype=EVENT_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def station_events(self, station: int | None = None):
+        return self.events if station is None else self.events[self.events['station'] == station]
+
+    def queue_series(self, station: int | None = None):
+        '''
+        Step series (times, queue length, users in service) after every event:
+        enter joins the queue, process moves from queue to service, out leaves service
+        '''
+        events = self.station_events(station)
+        kinds = np.asarray(events['kind'])
+        queue_steps = np.select([kinds == ENTER, kinds == PROCESS], [1, -1], 0)
+        service_steps = np.select([kinds == PROCESS, kinds == OUT], [1, -1], 0)
+        return np.asarray(events['time']), np.cumsum(queue_steps), np.cumsum(service_steps)
+
+    def timelines(self, station: int | None = None):
+        '''
+        Events grouped by user (CSR): returns user ids, offsets and events sorted by user (and time within user)
+        '''
+        events = self.station_events(station)
+        order = np.argsort(events['user'], kind='stable')
+        grouped = np.asarray(events[order])
+        users, starts = np.unique(grouped['user'], return_index=True)
+        return users, np.append(starts, len(grouped)), grouped
+
+    def user_timeline(self, user: int) -> np.ndarray:
+        return np.asarray(self.events[self.events['user'] == user])
+
+    def phase_times(self, start_kind: int, end_kind: int, station: int | None = None) -> np.ndarray:
+        '''
+        Time from start_kind to end_kind event of the same user and segment, for every pair present in trace
+        (e.g. ENTER -> PROCESS is waiting time, PROCESS -> OUT is service time)
+        '''
+        events = self.station_events(station)
+        keys = (np.asarray(events['user'], dtype=np.int64) << 32) | np.asarray(events['segment'], dtype=np.int64)
+        start_mask, end_mask = events['kind'] == start_kind, events['kind'] == end_kind
+        start_keys, start_times = keys[start_mask], np.asarray(events['time'][start_mask])
+        end_keys, end_times = keys[end_mask], np.asarray(events['time'][end_mask])
+        order = np.argsort(start_keys, kind='stable')
+        positions = np.searchsorted(start_keys[order], end_keys)
+        positions = np.minimum(positions, len(order) - 1)
+        matched = start_keys[order][positions] == end_keys if len(order) else np.zeros(len(end_keys), dtype=bool)
+        return end_times[matched] - start_times[order][positions[matched]]
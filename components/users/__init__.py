@@ -1,17 +1,25 @@
 from abc import ABC
+from array import array
+
+
+USER_TYPES = ('standard', 'premium', 'VIP') # default classes, index in tuple is user class code
 
 
 class User(ABC):
 
+    __slots__ = ('id', 'mean_file_size', 'mean_download_speed', 'enter_time', 'out_time')
+
     counter_general = 0
+    type = None
+    code = None
     
     def __init__(self, config: dict):
         self.__class__.counter_general += 1
         self.id = self.__class__.counter_general
         self.mean_file_size = config['mean_file_size']
         self.mean_download_speed = config['mean_download_speed']
-        self.enter_time = []
-        self.out_time = []
+        self.enter_time = array('d')
+        self.out_time = array('d')
 
     def __str__(self) -> str:
         return f'User {self.id}'
@@ -23,3 +31,18 @@ class User(ABC):
     def out(self, time) -> None:
         self.out_time.append(time)
         # print(f'{self} wychodzi z sieci w czasie {time}')
+
+
+def user_types(user_config: dict) -> tuple:
+    '''
+    Classes configured in user section of config (entries with arrival_wage) in order of config,
+    index in tuple is user class code
+    '''
+    return tuple(name for name, value in user_config.items() if isinstance(value, dict) and 'arrival_wage' in value)
+
+
+def user_class(name: str, code: int) -> type:
+    '''
+    Subclass of User for given class, with its own counter of ids
+    '''
+    return type(f'User_{name}', (User,), {'__slots__': (), 'type': name, 'code': code, 'counter_general': 0})
@@ -1,11 +0,0 @@
-from . import User
-
-
-class UserVIP(User):
-
-    counter = 0
-
-    def __init__(self, config: dict):
-        super().__init__(config)
-        self.__class__.counter += 1
-        self.type = 'VIP'
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class VariateStream:
+    '''
+    Random variates drawn from a Generator in large blocks and handed out one by one,
+    scalar numpy calls cost a few microseconds each
+    '''
+
+    def __init__(self, draw, block_size: int = 4096) -> None:
+        '''
+        draw: function returning numpy array of given size, e.g. lambda size: rng.exponential(2, size)
+        '''
+        self.draw = draw
+        self.block_size = block_size
+        self.block = []
+        self.index = 0
+
+    def refill(self) -> None:
+        self.block = self.draw(self.block_size).tolist()
+        self.index = 0
+
+    def next(self):
+        if self.index == len(self.block):
+            self.refill()
+        value = self.block[self.index]
+        self.index += 1
+        return value
+
+
+EPSILON = 2.0 ** -53  # uniforms are kept in [EPSILON, 1 - EPSILON], so that both u and 1 - u can be inverted
+
+
+def spawn_streams(rng: np.random.Generator, purposes) -> dict:
+    '''
+    Independent Generator per purpose (e.g. arrivals, classes, file sizes) spawned from rng.
+    Children depend only on the seed of a fresh rng, so scenarios run from the same seed see the same
+    variates of every purpose, however differently the other purposes are consumed (common random numbers).
+    '''
+    return dict(zip(purposes, rng.spawn(len(purposes))))
+
+
+def uniforms(rng: np.random.Generator, size, antithetic: bool = False) -> np.ndarray:
+    u = np.clip(rng.random(size), EPSILON, 1 - EPSILON)
+    return 1 - u if antithetic else u
+
+
+def exponential_variates(rng: np.random.Generator, scale: float, size, antithetic: bool = False) -> np.ndarray:
+    '''
+    Exponential variates by inversion, so that antithetic run gets -scale * log(u) for its pair's -scale * log(1 - u)
+    '''
+    return -scale * np.log1p(-uniforms(rng, size, antithetic))
+
+
+def standard_normal_variates(rng: np.random.Generator, size, antithetic: bool = False) -> np.ndarray:
+    z = rng.standard_normal(size)
+    return -z if antithetic else z
+
+
+def choice_stream(rng: np.random.Generator, probabilities, block_size: int = 4096, antithetic: bool = False) -> VariateStream:
+    '''
+    Stream of indexes drawn with given probabilities, inverse CDF is computed once instead of on every call
+    '''
+    cdf = np.cumsum(probabilities, dtype=float)
+    cdf /= cdf[-1]
+    return VariateStream(lambda size: np.searchsorted(cdf, uniforms(rng, size, antithetic), side='right'), block_size)
+
+
+def exponential_stream(rng: np.random.Generator, scale: float, block_size: int = 4096, antithetic: bool = False) -> VariateStream:
+    return VariateStream(lambda size: exponential_variates(rng, scale, size, antithetic), block_size)
+
+
+def standard_normal_stream(rng: np.random.Generator, block_size: int = 4096, antithetic: bool = False) -> VariateStream:
+    return VariateStream(lambda size: standard_normal_variates(rng, size, antithetic), block_size)
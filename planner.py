@@ -0,0 +1,180 @@
+import argparse
+import copy
+import math
+
+import numpy as np
+import yaml
+
+from analytic import FCFS_STATIONS, class_demands, erlang_c, station_loads
+from bcmp import Net, load_file
+from components.progress import DivergenceGuard, combine
+from components.recorder import UserTimes
+
+
+def channel_bounds(config: dict, percentile: float) -> dict:
+    '''
+    Per station (lower, upper) channel counts from Erlang-C of the default topology:
+        lower - the least stable count (utilisation below 1), anything less diverges
+        upper - the least count with probability of waiting at most 1 - percentile,
+                so the percentile of waiting time is 0 and only service time is left
+    '''
+    bounds = {}
+    for station, (arrival_rate, mean_service, _) in station_loads(class_demands(config)).items():
+        offered_load = arrival_rate * mean_service
+        lower = math.floor(offered_load) + 1
+        upper = lower
+        while erlang_c(upper, offered_load) > 1 - percentile / 100:
+            upper += 1
+        bounds[station] = (lower, upper)
+    return bounds
+
+
+class SlaGuard:
+    '''
+    Observer rejecting candidate early: after warm-up running mean response of some class already exceeds
+    its limit, and percentiles of latency are never below the mean for right-skewed distributions
+    '''
+
+    def __init__(self, targets: dict, warmup: float) -> None:
+        self.targets = targets
+        self.warmup = warmup
+
+    def __call__(self, snapshot: dict) -> bool:
+        if snapshot['time'] < self.warmup:
+            return False
+        for type, target in self.targets.items():
+            mean = snapshot['classes'][type][target.get('metric', 'response')]
+            if mean is not None and mean > target['limit']:
+                return True
+        return False
+
+
+def class_percentiles(net: Net, targets: dict, warmup: float) -> dict:
+    '''
+    Percentile of response time of users who entered after warm-up, per class with target.
+    Users still in net are counted up to the end of simulation.
+    '''
+    user_times = UserTimes(net.users, net.end_time)
+    visited = user_times.offsets[1:] > user_times.offsets[:-1]
+    first_enter = np.full(len(user_times), -math.inf)
+    first_enter[visited] = user_times.enter_time[user_times.offsets[:-1][visited]]
+    times = {
+        'response': user_times.times_in_system(),
+        'response_without_segmented': user_times.times_in_visits(),
+    }
+    percentiles = {}
+    for type, target in targets.items():
+        mask = (first_enter >= warmup) & (user_times.class_codes == net.types.index(type))
+        values = times[target.get('metric', 'response')][mask]
+        percentiles[type] = float(np.percentile(values, target.get('percentile', 95))) if len(values) else math.nan
+    return percentiles
+
+
+class Planner:
+    '''
+    Searches the least channel counts of stations meeting per-class response time targets.
+    Every candidate is simulated with the same seeds (common random numbers), so neighbouring candidates
+    differ by the channel count rather than by noise.
+    '''
+
+    def __init__(self, config: dict, spec: dict) -> None:
+        self.config = copy.deepcopy(config)
+        self.config['simulation'].update({'time': spec.get('time', 1800), 'trace': False, 'streaming': False, 'retire_users': False})
+        self.config['simulation'].pop('stopping', None)
+        self.targets = spec['targets']
+        self.stations = spec.get('stations', list(FCFS_STATIONS))
+        self.max_channels = spec.get('max_channels', 500)
+        self.warmup = spec.get('warmup', 300)
+        self.seed = spec.get('seed', 0)
+        self.replications = spec.get('replications', 3)
+        self.check_interval = spec.get('check_interval', 60)
+        self.evaluations = {}  # channels -> result
+
+    def evaluate(self, channels: dict) -> dict:
+        '''
+        Simulates candidate, replications are stopped at the first early rejection
+        '''
+        key = tuple(channels[station] for station in self.stations)
+        if key in self.evaluations:
+            return self.evaluations[key]
+        config = copy.deepcopy(self.config)
+        for station, number_of_channels in channels.items():
+            config[station]['number_of_channels'] = number_of_channels
+        samples = {type: [] for type in self.targets}
+        result = {'feasible': False, 'percentiles': None, 'rejected_at': None}
+        for seed in np.random.SeedSequence(self.seed).spawn(self.replications):
+            net = Net(config, rng=np.random.default_rng(seed))
+            net.run(observer=combine(SlaGuard(self.targets, self.warmup), DivergenceGuard()), snapshot_interval=self.check_interval)
+            if net.aborted:
+                result['rejected_at'] = net.end_time
+                break
+            for type, value in class_percentiles(net, self.targets, self.warmup).items():
+                samples[type].append(value)
+        else:
+            result['percentiles'] = {type: float(np.mean(values)) for type, values in samples.items()}
+            result['feasible'] = all(result['percentiles'][type] <= target['limit'] for type, target in self.targets.items())
+        self.evaluations[key] = result
+        print_evaluation(channels, result)
+        return result
+
+    def plan(self) -> dict | None:
+        '''
+        Starts from Erlang-C upper bounds (doubled until feasible), then bisects every station in turn
+        between its stability bound and the current feasible count. Returns None when targets are not met
+        even with max_channels.
+        '''
+        percentile = max(target.get('percentile', 95) for target in self.targets.values())
+        bounds = channel_bounds(self.config, percentile)
+        channels = {station: min(bounds[station][1], self.max_channels) for station in self.stations}
+        while not self.evaluate(channels)['feasible']:
+            if all(count >= self.max_channels for count in channels.values()):
+                return None
+            channels = {station: min(count * 2, self.max_channels) for station, count in channels.items()}
+
+        for station in self.stations:
+            infeasible, feasible = bounds[station][0] - 1, channels[station]
+            while feasible - infeasible > 1:
+                middle = (infeasible + feasible) // 2
+                if self.evaluate({**channels, station: middle})['feasible']:
+                    feasible = middle
+                else:
+                    infeasible = middle
+            channels[station] = feasible
+        return channels
+
+
+def print_evaluation(channels: dict, result: dict):
+    candidate = ', '.join(f'{station}={count}' for station, count in channels.items())
+    if result['percentiles'] is None:
+        print(f'{candidate}: odrzucone w czasie {result["rejected_at"]}')
+        return
+    percentiles = ', '.join(f'{type}: {value:.2f}' for type, value in result['percentiles'].items())
+    print(f"{candidate}: {'spełnia' if result['feasible'] else 'nie spełnia'} ({percentiles})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Least channel counts meeting per-class response time targets')
+    parser.add_argument('spec', help='YAML file with base config, targets, stations and simulation settings')
+    parser.add_argument('-o', '--output', metavar='FILE', help='save base config with planned channels')
+    args = parser.parse_args()
+
+    spec = load_file(args.spec)
+    config = load_file(spec.get('config', 'config_net.yaml'))
+    planner = Planner(config, spec)
+    channels = planner.plan()
+    print('')
+    if channels is None:
+        print(f'Cele nieosiągalne przy {planner.max_channels} kanałach.')
+        return
+    print(f'Najmniejsza liczba kanałów ({len(planner.evaluations)} symulowanych kandydatów):')
+    for station, count in channels.items():
+        print(f'\t{station}: {count}')
+    if args.output:
+        for station, count in channels.items():
+            config[station]['number_of_channels'] = count
+        with open(args.output, 'w') as file:
+            yaml.safe_dump(config, file, sort_keys=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import math
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+from bcmp import Net, load_file, net_histograms, print_percentiles, summarize_net
+from components.statistics import LogHistogram, merge_histograms, save_histograms
+
+
+def run_replication(config: dict, seed: np.random.SeedSequence, antithetic: bool = False) -> dict:
+    net = Net(config=config, rng=np.random.default_rng(seed), antithetic=antithetic)
+    net.run()
+    return summarize_net(net, end_time=net.end_time)
+
+
+def run_replication_histograms(config: dict, seed: np.random.SeedSequence, antithetic: bool = False) -> tuple:
+    '''
+    Summary and latency histograms (serialized, so they are cheap to send between processes)
+    '''
+    config = {**config, 'simulation': {**config['simulation'], 'histograms': True}}
+    net = Net(config=config, rng=np.random.default_rng(seed), antithetic=antithetic)
+    net.run()
+    histograms = {name: histogram.to_dict() for name, histogram in net_histograms(net).items()}
+    return summarize_net(net, end_time=net.end_time), histograms
+
+
+def confidence_interval(values, confidence: float = 0.95):
+    '''
+    Returns (mean, half width) of t-based confidence interval, NaN samples are skipped
+    '''
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return math.nan, math.nan
+    mean = float(np.mean(values))
+    if n == 1:
+        return mean, math.inf
+    half_width = stats.t.ppf((1 + confidence) / 2, n - 1) * np.std(values, ddof=1) / math.sqrt(n)
+    return mean, float(half_width)
+
+
+def pair_means(results) -> list:
+    '''
+    Averages consecutive (run, antithetic run) summaries, pair means are the independent samples
+    '''
+    return [
+        {metric: (value + antithetic[metric]) / 2 for metric, value in run.items()}
+        for run, antithetic in zip(results[::2], results[1::2])
+    ]
+
+
+def merge_replications(results, confidence: float = 0.95, antithetic: bool = False) -> dict:
+    samples = defaultdict(list)
+    for summary in (pair_means(results) if antithetic else results):
+        for metric, value in summary.items():
+            samples[metric].append(value)
+    return {metric: confidence_interval(values, confidence) for metric, values in samples.items()}
+
+
+def paired_differences(results, baseline_results) -> list:
+    '''
+    Per replication differences of metrics between scenario and baseline run with common random numbers
+    '''
+    return [
+        {metric: value - baseline[metric] for metric, value in summary.items()}
+        for summary, baseline in zip(results, baseline_results)
+    ]
+
+
+def replication_seeds(replications: int, seed=None, antithetic: bool = False):
+    '''
+    Seeds and antithetic flags of replications, with antithetic every spawned seed runs twice (plain and mirrored)
+    '''
+    if not antithetic:
+        return np.random.SeedSequence(seed).spawn(replications), [False] * replications
+    if replications % 2:
+        raise ValueError('Antithetic replications come in pairs, number of replications has to be even')
+    seeds = np.random.SeedSequence(seed).spawn(replications // 2)
+    return [s for s in seeds for _ in range(2)], [False, True] * (replications // 2)
+
+
+def run_replications(config: dict, replications: int, seed=None, workers=None, antithetic: bool = False, histograms: bool = False) -> list:
+    '''
+    Runs independent replications of Net in a process pool.
+    Every replication gets its own stream spawned from a single master seed,
+    so two configs run with the same seed share random numbers replication by replication.
+    With histograms every result is (summary, serialized histograms).
+    '''
+    seeds, antithetic_flags = replication_seeds(replications, seed, antithetic)
+    run = run_replication_histograms if histograms else run_replication
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        return [run(config, s, a) for s, a in zip(seeds, antithetic_flags)]
+    with ProcessPoolExecutor(max_workers=min(workers, replications)) as executor:
+        return list(executor.map(run, [config] * replications, seeds, antithetic_flags))
+
+
+def merge_replication_histograms(serialized) -> dict:
+    '''
+    Lossless merge of histograms of all replications, name by name
+    '''
+    return merge_histograms(
+        {name: LogHistogram.from_dict(data) for name, data in histograms.items()}
+        for histograms in serialized
+    )
+
+
+def print_merged(merged: dict, replications: int, confidence: float):
+    print(f'Wyniki z {replications} replikacji (przedział ufności {confidence:.0%}):')
+    for metric, (mean, half_width) in merged.items():
+        print(f'\t{metric}: {mean:.4f} ± {half_width:.4f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Independent replications of BCMP net')
+    parser.add_argument('-c', '--config', default='config_net.yaml')
+    parser.add_argument('-n', '--replications', type=int, default=30)
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--antithetic', action='store_true', help='run replications in antithetic pairs')
+    parser.add_argument('--compare', metavar='CONFIG', help='report paired differences of CONFIG minus config, run with common random numbers')
+    parser.add_argument('--histograms', metavar='FILE', help='merge latency histograms of all replications and save them to JSON file')
+    args = parser.parse_args()
+
+    config = load_file(args.config)
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy  # shared by compared configs
+    results = run_replications(config, args.replications, seed=seed, workers=args.workers, antithetic=args.antithetic, histograms=bool(args.histograms))
+    if args.histograms:
+        results, serialized = zip(*results)
+        histograms = merge_replication_histograms(serialized)
+        save_histograms(histograms, args.histograms)
+    print_merged(merge_replications(results, args.confidence, args.antithetic), args.replications, args.confidence)
+    if args.histograms:
+        print('')
+        print_percentiles(histograms)
+    if args.compare:
+        compared_results = run_replications(load_file(args.compare), args.replications, seed=seed, workers=args.workers, antithetic=args.antithetic)
+        print(f'\n{args.compare}:')
+        print_merged(merge_replications(compared_results, args.confidence, args.antithetic), args.replications, args.confidence)
+        print(f'\nRóżnica {args.compare} - {args.config} (pary replikacji ze wspólnymi liczbami losowymi):')
+        differences = paired_differences(compared_results, results)
+        print_merged(merge_replications(differences, args.confidence, args.antithetic), args.replications, args.confidence)
+
+
+if __name__ == '__main__':
+    main()
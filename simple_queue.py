@@ -1,3 +1,5 @@
+import argparse
+import os
 from typing import Dict
 from queue import Queue
 import math
@@ -5,7 +7,12 @@ import math
 import yaml
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt  
+
+from components.plotting import downsample_steps, figure_width_px
+from components.progress import CountingEnvironment, DivergenceGuard, Progress, SnapshotWriter, combine, run_in_slices
+from components.statistics import RunningStats
+from components.tracing import ENTER, OUT, PROCESS, TRACE_LEVELS, create_tracer
+from components.variates import exponential_stream, exponential_variates, spawn_streams, standard_normal_stream, standard_normal_variates
 
 
 def load_file(filename):
@@ -15,7 +22,7 @@ def load_file(filename):
 
 class QueueSystem:
     
-    def __init__(self, is_segmented: bool, config: Dict[str, int]) -> None:
+    def __init__(self, is_segmented: bool, config: Dict[str, int], rng: np.random.Generator | None = None, env: simpy.Environment | None = None, antithetic: bool = False, tracer=None) -> None:
         self.time = config['time']
         self.avg_arrival_time = config['avg_arrival_time']
         self.mean_file_size = config['mean_file_size']
@@ -23,13 +30,20 @@ class QueueSystem:
         self.segment_size = config['segment_size']
         self.segment_watchtime = config['segment_watchtime']
         self.is_segmented = is_segmented
+        self.rng = rng if rng is not None else np.random.default_rng()
+        streams = spawn_streams(self.rng, ('arrivals', 'file_sizes'))  # segmented and non-segmented runs from one seed see the same users
+        self.interarrival_times = exponential_stream(streams['arrivals'], self.avg_arrival_time, antithetic=antithetic)
+        self.file_size_deviations = standard_normal_stream(streams['file_sizes'], antithetic=antithetic)
         self.users = Queue()
         self.queue_data = []  # Lista do przechowywania danych o długości kolejki
         self.in_service_data = []  # Lista do przechowywania danych o liczbie obsługiwanych użytkowników
         self.waiting_times = []  # Lista do przechowywania czasów oczekiwania użytkowników
         self.service_times = []  # Lista do przechowywania czasów obsługi użytkowników
+        self.waiting_stats = RunningStats()  # bieżące statystyki czasów oczekiwania (podgląd w trakcie symulacji)
+        self.service_stats = RunningStats()
+        self.tracer = tracer  # EventTraceWriter or ConsoleTracer, None switches tracing off
 
-        self.env = simpy.Environment()
+        self.env = env if env is not None else simpy.Environment()
         self.service = simpy.Resource(self.env, capacity=config['number_of_servers'])
 
     class User:
@@ -47,17 +61,14 @@ class QueueSystem:
         def __str__(self) -> str:
             return f'User {self.id}'
         
-        def enter(self, time, segment_number=0) -> None:
+        def enter(self, time) -> None:
             self.enter_time.append(time)
-            print(f'{self} przychodzi w czasie {time}, segment {segment_number + 1} / {self.segments}')
 
-        def process(self, time, segment_number=0) -> None:
+        def process(self, time) -> None:
             self.process_time.append(time)
-            print(f'{self} jest obsługiwany w czasie {time}, segment {segment_number + 1} / {self.segments}')
 
-        def out(self, time, segment_number=0) -> None:
+        def out(self, time) -> None:
             self.out_time.append(time)
-            print(f'{self} zakończył obsługę w czasie {time}, segment {segment_number + 1} / {self.segments}')
 
     def track_queue_length_and_service(self, time):
         queue_length = len(self.service.queue)
@@ -69,8 +80,10 @@ class QueueSystem:
         enter_time = self.env.now
         user.enter(enter_time)
         self.track_queue_length_and_service(enter_time)
+        if self.tracer is not None:
+            self.tracer.write(enter_time, user.id, 0, ENTER)
         
-        file_size = abs(np.random.normal(self.mean_file_size))
+        file_size = abs(self.mean_file_size + self.file_size_deviations.next())
         download_time = file_size / self.mean_download_speed
 
         with self.service.request() as request:
@@ -78,14 +91,20 @@ class QueueSystem:
             process_time = self.env.now
             user.process(process_time)
             self.track_queue_length_and_service(process_time)
+            if self.tracer is not None:
+                self.tracer.write(process_time, user.id, 0, PROCESS)
+            self.waiting_stats.add(process_time - enter_time)
             
             yield self.env.timeout(download_time)
             out_time = self.env.now
             user.out(out_time)
             self.track_queue_length_and_service(out_time)
+            if self.tracer is not None:
+                self.tracer.write(out_time, user.id, 0, OUT)
+            self.service_stats.add(out_time - process_time)
 
     def user_process_segmented(self, user: User):     
-        file_size = abs(np.random.normal(self.mean_file_size))
+        file_size = abs(self.mean_file_size + self.file_size_deviations.next())
         
         full_segments_number = math.floor(file_size / self.segment_size)
         segments = [self.segment_size for _ in range(full_segments_number)]
@@ -94,60 +113,200 @@ class QueueSystem:
         
         for i, segment in enumerate(segments):
             enter_time = self.env.now
-            user.enter(enter_time, i)
+            user.enter(enter_time)
             self.track_queue_length_and_service(enter_time)
+            if self.tracer is not None:
+                self.tracer.write(enter_time, user.id, i, ENTER)
             
             download_time = segment / self.mean_download_speed
             with self.service.request() as request:
                 yield request
                 process_time = self.env.now
-                user.process(process_time, i)
+                user.process(process_time)
                 self.track_queue_length_and_service(process_time)
+                if self.tracer is not None:
+                    self.tracer.write(process_time, user.id, i, PROCESS)
+                self.waiting_stats.add(process_time - enter_time)
                 
                 yield self.env.timeout(download_time)
                 out_time = self.env.now
-                user.out(out_time, i)
+                user.out(out_time)
                 self.track_queue_length_and_service(out_time)
+                if self.tracer is not None:
+                    self.tracer.write(out_time, user.id, i, OUT)
+                self.service_stats.add(out_time - process_time)
             yield self.env.timeout(self.segment_watchtime)
     
     def gen_users(self):
         while True:
-            yield self.env.timeout(np.random.exponential(self.avg_arrival_time))
+            yield self.env.timeout(self.interarrival_times.next())
             user = self.User()
             self.users.put(user)
             self.env.process(self.user_process_segmented(user) if self.is_segmented else self.user_process(user))
 
-    def run(self):
+    def snapshot(self, progress: Progress) -> dict:
+        stations = {
+            'service': {
+                'queue_length': len(self.service.queue),
+                'in_service': self.service.count,
+                'utilisation': self.service.count / self.service.capacity,
+            }
+        }
+        means = {
+            'waiting_time': self.waiting_stats.mean if self.waiting_stats.count else None,
+            'service_time': self.service_stats.mean if self.service_stats.count else None,
+        }
+        return {'time': self.env.now, **progress.rates(), 'users': self.users.qsize(), 'stations': stations, 'means': means}
+
+    def run(self, observer=None, snapshot_interval: float = 60):
+        '''
+        With observer, every snapshot_interval of simulated time observer(snapshot) is called,
+        returning True aborts the run (self.aborted is then set)
+        '''
         self.env.process(self.gen_users())
-        self.env.run(until=self.time)
+        self.aborted = False
+        if observer is None:
+            self.env.run(until=self.time)
+            return
+        progress = Progress(self.env)
+
+        def observe():
+            self.aborted = bool(observer(self.snapshot(progress)))
+            return self.aborted
+        run_in_slices(self.env, self.time, [(snapshot_interval, observe)])
+
+
+class QueueSystemLindley:
+    '''
+    Non-segmented G/G/c FIFO queue without simpy: all interarrival and service times are drawn as arrays
+    and start of service follows the multi-server Lindley (Kiefer-Wolfowitz) recursion,
+    vectorized over replications batched along the first array axis
+    '''
+
+    def __init__(self, is_segmented: bool, config: Dict[str, int], rng: np.random.Generator | None = None, antithetic: bool = False) -> None:
+        if is_segmented:
+            raise ValueError('Lindley backend supports only non-segmented queue')
+        self.time = config['time']
+        self.avg_arrival_time = config['avg_arrival_time']
+        self.mean_file_size = config['mean_file_size']
+        self.mean_download_speed = config['mean_download_speed']
+        self.number_of_servers = config['number_of_servers']
+        self.is_segmented = False
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.streams = spawn_streams(self.rng, ('arrivals', 'file_sizes'))  # the same variates as QueueSystem from the same seed
+        self.antithetic = antithetic
+        self.users = Queue()
+        self.queue_data = []
+        self.in_service_data = []
+
+    def draw_arrivals(self, replications: int) -> np.ndarray:
+        '''
+        Arrival times of shape (replications, n), n large enough to cover simulation time in every replication
+        '''
+        expected = self.time / self.avg_arrival_time
+        size = int(expected + 6 * math.sqrt(expected) + 10)
+        draw = lambda: exponential_variates(self.streams['arrivals'], self.avg_arrival_time, (replications, size), self.antithetic)
+        arrivals = np.cumsum(draw(), axis=1)
+        while (arrivals[:, -1] < self.time).any():
+            extension = np.cumsum(draw(), axis=1)
+            arrivals = np.hstack((arrivals, arrivals[:, -1:] + extension))
+        return arrivals[:, :int((arrivals < self.time).sum(axis=1).max())]
+
+    def run_batch(self, replications: int) -> Dict[str, np.ndarray]:
+        '''
+        Returns arrival, start of service and departure times of shape (replications, n),
+        mask marks users that arrived before the end of simulation
+        '''
+        arrivals = self.draw_arrivals(replications)
+        service = np.abs(self.mean_file_size + standard_normal_variates(self.streams['file_sizes'], arrivals.shape, self.antithetic)) / self.mean_download_speed
+        starts = np.empty_like(arrivals)
+        free_at = np.zeros((replications, self.number_of_servers))  # time when every server becomes free
+        rows = np.arange(replications)
+        for i in range(arrivals.shape[1]):
+            server = free_at.argmin(axis=1)
+            start = np.maximum(arrivals[:, i], free_at[rows, server])
+            starts[:, i] = start
+            free_at[rows, server] = start + service[:, i]
+        return {
+            'arrivals': arrivals,
+            'starts': starts,
+            'departures': starts + service,
+            'mask': arrivals < self.time,
+        }
+
+    def batch_statistics(self, batch: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        '''
+        Per replication mean waiting and service time, truncated at the end of simulation as in calculate_statistics
+        '''
+        mask = batch['mask']
+        started = mask & (batch['starts'] < self.time)
+        waiting = np.where(mask, np.minimum(batch['starts'], self.time) - batch['arrivals'], 0)
+        service = np.where(started, np.minimum(batch['departures'], self.time) - batch['starts'], 0)
+        return {
+            'avg_waiting_time': waiting.sum(axis=1) / np.maximum(mask.sum(axis=1), 1),
+            'avg_service_time': service.sum(axis=1) / np.maximum(started.sum(axis=1), 1),
+        }
+
+    def run(self):
+        batch = self.run_batch(1)
+        mask = batch['mask'][0]
+        arrivals, starts, departures = batch['arrivals'][0][mask], batch['starts'][0][mask], batch['departures'][0][mask]
+
+        for enter_time, process_time, out_time in zip(arrivals, starts, departures):
+            user = QueueSystem.User()
+            user.enter_time.append(enter_time)
+            if process_time < self.time:
+                user.process_time.append(process_time)
+            if out_time < self.time:
+                user.out_time.append(out_time)
+            self.users.put(user)
+
+        # state after every arrival, end and start of service (in that order when at the same time)
+        starts, departures = starts[starts < self.time], departures[departures < self.time]
+        times = np.concatenate((arrivals, departures, starts))
+        order = np.lexsort((np.repeat((0, 1, 2), (len(arrivals), len(departures), len(starts))), times))
+        queue_steps = np.concatenate((np.ones(len(arrivals)), np.zeros(len(departures)), -np.ones(len(starts))))
+        service_steps = np.concatenate((np.zeros(len(arrivals)), -np.ones(len(departures)), np.ones(len(starts))))
+        times = times[order].tolist()
+        self.queue_data = list(zip(times, np.cumsum(queue_steps[order]).astype(int).tolist()))
+        self.in_service_data = list(zip(times, np.cumsum(service_steps[order]).astype(int).tolist()))
 
 
-def plot_queue_and_service_data(system: QueueSystem, end_time):  
+def plot_queue_and_service_data(system: QueueSystem, end_time, expected: dict | None = None):
+    '''
+    expected - optional transient curves (see transient.transient_curves) drawn over the simulated series
+    '''
+    import matplotlib.pyplot as plt
+
     if not system.queue_data or not system.in_service_data:
         print("Brak danych do wyświetlenia wykresów.")
         return
 
-    times_queue, queue_lengths = zip(*system.queue_data)
-    times_service, in_service_lengths = zip(*system.in_service_data)
-
     fig, axs = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+    width = figure_width_px(fig)
+    times_queue, queue_lengths = downsample_steps(*zip(*system.queue_data), end_time, width)
+    times_service, in_service_lengths = downsample_steps(*zip(*system.in_service_data), end_time, width)
 
     # Pierwszy wykres - liczba użytkowników w kolejce
-    axs[0].stairs(queue_lengths, list(times_queue) + [end_time], fill=True, color='blue', label='Users in Queue')
+    axs[0].stairs(queue_lengths, np.append(times_queue, end_time), fill=True, color='blue', label='Users in Queue')
     axs[0].set_ylabel('Users in Queue')
     axs[0].set_title(f"Queue Length Over Time - {'Segmented' if system.is_segmented else 'Non-Segmented'}")
+    if expected is not None:
+        axs[0].plot(expected['time'], expected['queue_length'], color='black', label='E[Users in Queue] (M/M/c)')
     axs[0].legend()
-    axs[0].set_ylim(0, max(queue_lengths) + 1)
+    axs[0].set_ylim(0, max(max(queue_lengths), max(expected['queue_length']) if expected is not None else 0) + 1)
     axs[0].set_xlim(0, end_time)
     axs[0].grid(True)
 
     # Drugi wykres - liczba obsługiwanych użytkowników
-    axs[1].stairs(in_service_lengths, list(times_service) + [end_time], fill=True, color='green', label='Users in Service')
+    axs[1].stairs(in_service_lengths, np.append(times_service, end_time), fill=True, color='green', label='Users in Service')
     axs[1].set_xlabel('Time')
     axs[1].set_ylabel('Users in Service')
     axs[1].set_title("Number of Users in Service Over Time")
+    if expected is not None:
+        axs[1].plot(expected['time'], expected['in_service'], color='black', label='E[Users in Service] (M/M/c)')
     axs[1].legend()
-    max_in_service = max(in_service_lengths) if in_service_lengths else 1
+    max_in_service = max(in_service_lengths) if len(in_service_lengths) else 1
     axs[1].set_ylim(0, max_in_service + 1)  # Dodano margines dla osi Y, aby uwzględnić pełen zakres
     axs[1].set_xlim(0, end_time)
     axs[1].grid(True)
@@ -182,26 +341,107 @@ def calculate_statistics(system: QueueSystem, end_time):
     print("\nPodejście segmentowe:" if system.is_segmented else "\nPodejście z jednokrotnym pobieraniem:")
     print(f"Średni czas oczekiwania w kolejce: {avg_waiting_time}")
     print(f"Średni czas obsługi użytkownika: {avg_service_time}")
+    return avg_waiting_time, avg_service_time
+
+
+def export_results(systems: Dict[str, QueueSystem], statistics: Dict[str, tuple], filename):
+    '''
+    Saves queue and service series together with mean times of every system into a single .npz file
+    '''
+    arrays = {}
+    for name, system in systems.items():
+        for series_name, series in (('queue', system.queue_data), ('in_service', system.in_service_data)):
+            times, values = zip(*series) if series else ((), ())
+            arrays[f'{name}.{series_name}.time'] = np.array(times, dtype=float)
+            arrays[f'{name}.{series_name}.data'] = np.array(values, dtype=int)
+        avg_waiting_time, avg_service_time = statistics[name]
+        arrays[f'summary.{name}.avg_waiting_time'] = np.array(avg_waiting_time)
+        arrays[f'summary.{name}.avg_service_time'] = np.array(avg_service_time)
+    np.savez_compressed(filename, **arrays)
+
+
+def suffixed(filename: str, name: str) -> str:
+    '''
+    Filename with name of system inserted before extension (appended when there is none)
+    '''
+    stem, extension = os.path.splitext(filename)
+    return f'{stem}.{name}{extension}'
 
 
 def main():
-    config = load_file('config.yaml')
+    parser = argparse.ArgumentParser(description='Simulation of queue with single and segmented download')
+    parser.add_argument('-c', '--config', default='config_queue.yaml')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('--no-plot', action='store_true', help='do not import matplotlib nor build figures')
+    parser.add_argument('--export', metavar='FILE', help='save series and summary to .npz file')
+    parser.add_argument('--snapshots', metavar='FILE', help='write periodic snapshots of simpy runs to rotating .jsonl or .npz files, suffixed by system name')
+    parser.add_argument('--snapshot-interval', type=float, default=60, help='simulated seconds between snapshots')
+    parser.add_argument('--abort-diverging', action='store_true', help='stop run when queue keeps growing')
+    parser.add_argument('--trace-level', choices=TRACE_LEVELS, default='off', help='events of simpy runs: binary file or console (slow)')
+    parser.add_argument('--trace-file', default='trace.bin', help='binary trace, suffixed by system name (see analyze_trace.py)')
+    parser.add_argument('--transient', action='store_true', help='compare non-segmented run with transient M/M/c solution (see transient.py)')
+    args = parser.parse_args()
+
+    config = load_file(args.config)
+    # common random numbers: both systems are seeded alike, so they serve the same users
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+
+    def run(system, name):
+        if isinstance(system, QueueSystemLindley):
+            system.run()
+            return
+        observers = []
+        if args.snapshots:
+            writer = SnapshotWriter(suffixed(args.snapshots, name))
+            observers.append(writer)
+        if args.abort_diverging:
+            observers.append(DivergenceGuard())
+        system.run(observer=combine(*observers) if observers else None, snapshot_interval=args.snapshot_interval)
+        if args.snapshots:
+            writer.close()
+        if system.tracer is not None:
+            system.tracer.close()
+        if system.aborted:
+            print(f'Symulacja {name} przerwana w czasie {system.env.now}: rosnąca kolejka')
     
-    system_not_segmented = QueueSystem(is_segmented=False, config=config)
-    system_not_segmented.run()
+    env = CountingEnvironment if args.snapshots else simpy.Environment
+
+    def tracer(name):
+        return create_tracer(args.trace_level, suffixed(args.trace_file, name))
+
+    backend = QueueSystemLindley if config.get('backend', 'simpy') == 'lindley' else QueueSystem
+    if backend is QueueSystem:
+        system_not_segmented = QueueSystem(is_segmented=False, config=config, rng=np.random.default_rng(seed), env=env(), tracer=tracer('not_segmented'))
+    else:
+        system_not_segmented = QueueSystemLindley(is_segmented=False, config=config, rng=np.random.default_rng(seed))
+    run(system_not_segmented, 'not_segmented')
     QueueSystem.User.counter = 0
-    system_segmented = QueueSystem(is_segmented=True, config=config)
-    system_segmented.run()
+    system_segmented = QueueSystem(is_segmented=True, config=config, rng=np.random.default_rng(seed), env=env(), tracer=tracer('segmented'))
+    run(system_segmented, 'segmented')
     
     # Wyświetl statystyki przed wykresem
     end_time = config['time']
-    calculate_statistics(system_not_segmented, end_time=end_time)
-    plot_queue_and_service_data(system_not_segmented, end_time=end_time)
-
-    calculate_statistics(system_segmented, end_time=end_time)
-    plot_queue_and_service_data(system_segmented, end_time=end_time)
-
-    plt.show()
+    systems = {'not_segmented': system_not_segmented, 'segmented': system_segmented}
+    statistics = {name: calculate_statistics(system, end_time=end_time) for name, system in systems.items()}
+    print("\nRóżnica (segmentowe - jednokrotne, ci sami użytkownicy):")
+    print(f"Czas oczekiwania w kolejce: {statistics['segmented'][0] - statistics['not_segmented'][0]}")
+    print(f"Czas obsługi użytkownika: {statistics['segmented'][1] - statistics['not_segmented'][1]}")
+    if args.export:
+        export_results(systems, statistics, args.export)
+    expected = None
+    if args.transient:
+        from transient import print_curves, transient_curves
+
+        expected = transient_curves(config)
+        print('')
+        print_curves(expected)
+
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+
+        plot_queue_and_service_data(system_not_segmented, end_time=end_time, expected=expected)
+        plot_queue_and_service_data(system_segmented, end_time=end_time)
+        plt.show()
 
 
 if __name__ == '__main__':
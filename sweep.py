@@ -0,0 +1,149 @@
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import qmc
+
+from bcmp import load_file
+from replications import merge_replications, run_replication
+
+
+def set_parameter(config: dict, path: str, value) -> None:
+    '''
+    Sets value under dotted path, e.g. 'FIFO.number_of_channels'
+    '''
+    *keys, last = path.split('.')
+    for key in keys:
+        config = config[key]
+    config[last] = value
+
+
+def config_hash(config: dict) -> str:
+    '''
+    Canonical hash of config, independent of key order and YAML formatting
+    '''
+    return hashlib.sha256(json.dumps(config, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def expand_grid(parameters: dict) -> list:
+    '''
+    parameters: dotted path -> list of values, returns list of {path: value} for every combination
+    '''
+    paths = list(parameters)
+    return [dict(zip(paths, values)) for values in itertools.product(*parameters.values())]
+
+
+def expand_latin_hypercube(parameters: dict, samples: int, seed=None) -> list:
+    '''
+    parameters: dotted path -> {'min': , 'max': , 'integer': bool}, returns list of {path: value}
+    '''
+    paths = list(parameters)
+    unit = qmc.LatinHypercube(d=len(paths), seed=seed).random(samples)
+    points = []
+    for row in unit:
+        point = {}
+        for path, u in zip(paths, row):
+            bounds = parameters[path]
+            if bounds.get('integer', False):
+                point[path] = int(math.floor(bounds['min'] + u * (bounds['max'] - bounds['min'] + 1)))
+            else:
+                point[path] = float(bounds['min'] + u * (bounds['max'] - bounds['min']))
+        points.append(point)
+    return points
+
+
+def expand(spec: dict) -> list:
+    if 'grid' in spec:
+        return expand_grid(spec['grid'])
+    return expand_latin_hypercube(spec['latin_hypercube']['parameters'], spec['latin_hypercube']['samples'], spec.get('seed'))
+
+
+class ResultCache:
+    '''
+    One JSON file per (config, seed, replications), named by hash of all three
+    '''
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, config: dict, seed, replications: int) -> str:
+        return config_hash({'config': config, 'seed': seed, 'replications': replications})
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key: str):
+        try:
+            with open(self.path(key), 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, result: dict) -> None:
+        temporary = self.path(key) + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(result, file)
+        os.replace(temporary, self.path(key))
+
+
+def run_point(config: dict, seed, replications: int) -> dict:
+    '''
+    Merged replications of a single sweep point, replication streams are spawned from the point's seed
+    '''
+    results = [run_replication(config, s) for s in np.random.SeedSequence(seed).spawn(replications)]
+    return {
+        metric: {'mean': mean, 'half_width': half_width}
+        for metric, (mean, half_width) in merge_replications(results).items()
+    }
+
+
+def run_sweep(base_config: dict, spec: dict, cache: ResultCache, workers=None) -> list:
+    '''
+    Runs every point of the sweep not found in cache, returns list of (point, summary) in spec order
+    '''
+    seed = spec.get('seed', 0)
+    replications = spec.get('replications', 1)
+    points = expand(spec)
+    configs, keys = [], []
+    for point in points:
+        config = copy.deepcopy(base_config)
+        for path, value in point.items():
+            set_parameter(config, path, value)
+        configs.append(config)
+        keys.append(cache.key(config, seed, replications))
+
+    missing = [i for i, key in enumerate(keys) if cache.get(key) is None]
+    print(f'Punkty: {len(points)}, w cache: {len(points) - len(missing)}, do policzenia: {len(missing)}')
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {i: executor.submit(run_point, configs[i], seed, replications) for i in missing}
+            for i, future in futures.items():
+                cache.put(keys[i], {'point': points[i], 'summary': future.result()})
+    return [(point, cache.get(key)['summary']) for point, key in zip(points, keys)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parameter sweep of BCMP net with on-disk result cache')
+    parser.add_argument('spec', help='YAML file with base config, grid or latin_hypercube, seed and replications')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('-m', '--metrics', nargs='*', default=['class.standard.response', 'class.premium.response', 'class.VIP.response_without_segmented'])
+    args = parser.parse_args()
+
+    spec = load_file(args.spec)
+    base_config = load_file(spec.get('config', 'config_net.yaml'))
+    cache = ResultCache(spec.get('cache', '.sweep_cache'))
+    for point, summary in run_sweep(base_config, spec, cache, workers=args.workers):
+        print(', '.join(f'{path}={value}' for path, value in point.items()))
+        for metric in args.metrics:
+            print(f"\t{metric}: {summary[metric]['mean']:.4f} ± {summary[metric]['half_width']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import math
+import time as timer
+
+import numpy as np
+from scipy import sparse
+from scipy import stats
+
+from simple_queue import load_file
+
+
+def generator_matrix(arrival_rate: float, service_rate: float, servers: int, capacity: int) -> sparse.csr_matrix:
+    '''
+    Generator of M/M/c/K birth-death chain, state is the number of users in system (0..capacity)
+    '''
+    states = np.arange(capacity + 1)
+    births = np.full(capacity, arrival_rate)
+    deaths = np.minimum(states[1:], servers) * service_rate
+    Q = sparse.diags([deaths, births], [-1, 1], shape=(capacity + 1, capacity + 1), format='lil')
+    Q.setdiag(-np.asarray(Q.sum(axis=1)).ravel())
+    return Q.tocsr()
+
+
+def uniformization(Q: sparse.csr_matrix, initial, times, tolerance: float = 1e-10) -> np.ndarray:
+    '''
+    Transient distributions p(t) = p(0) exp(Qt) at given increasing times, by uniformization:
+    P = I + Q / rate, p(t + dt) = sum_k Poisson(k; rate * dt) p(t) P^k, the sum truncated at 1 - tolerance of the mass.
+    Every step starts from the previous distribution, so the Poisson sums stay short.
+    '''
+    rate = float(-Q.diagonal().min()) or 1.0
+    P_transposed = (sparse.identity(Q.shape[0], format='csr') + Q / rate).T.tocsr()
+    distribution = np.asarray(initial, dtype=float)
+    distributions = np.empty((len(times), Q.shape[0]))
+    previous_time = 0.0
+    for i, time in enumerate(times):
+        mean = rate * (time - previous_time)
+        if mean > 0:
+            right = int(stats.poisson.ppf(1 - tolerance, mean)) + 1
+            weights = stats.poisson.pmf(np.arange(right + 1), mean)
+            term = distribution
+            result = weights[0] * term
+            for k in range(1, right + 1):
+                term = P_transposed @ term
+                result += weights[k] * term
+            distribution = result / result.sum()
+        distributions[i] = distribution
+        previous_time = time
+    return distributions
+
+
+def transient_curves(config: dict, points: int = 361, capacity: int | None = None, tolerance: float = 1e-10) -> dict:
+    '''
+    Expected queue length, users in service and waiting time of user arriving at t, from empty system,
+    for non-segmented queue with service time approximated as exponential with the same mean.
+    Waiting time of arriving user follows from PASTA: with n >= c users in system it waits for n - c + 1 departures.
+    '''
+    arrival_rate = 1 / config['avg_arrival_time']
+    service_rate = config['mean_download_speed'] / config['mean_file_size']
+    servers = config['number_of_servers']
+    times = np.linspace(0, config['time'], points)
+    if capacity is None:
+        # far beyond the largest queue that can build up by the end: all arrivals with no departure, plus margin
+        expected_arrivals = arrival_rate * config['time']
+        capacity = servers + int(expected_arrivals + 10 * math.sqrt(expected_arrivals) + 50)
+    Q = generator_matrix(arrival_rate, service_rate, servers, capacity)
+    initial = np.zeros(capacity + 1)
+    initial[0] = 1.0
+    distributions = uniformization(Q, initial, times, tolerance)
+
+    states = np.arange(capacity + 1)
+    waiting = np.maximum(states - servers + 1, 0) / (servers * service_rate)
+    return {
+        'time': times,
+        'queue_length': distributions @ np.maximum(states - servers, 0),
+        'in_service': distributions @ np.minimum(states, servers),
+        'waiting_time': distributions @ waiting,
+        'truncated_mass': distributions[:, -1],
+    }
+
+
+def time_average(times, values) -> float:
+    '''
+    Average of curve over [times[0], times[-1]] (trapezoidal rule)
+    '''
+    return float(np.trapezoid(values, times) / (times[-1] - times[0])) if times[-1] > times[0] else float(values[0])
+
+
+def print_curves(curves: dict):
+    times = curves['time']
+    print('Analiza przejściowa (M/M/c od pustego systemu, uniformizacja):')
+    print(f"\tśrednia długość kolejki w [0, {times[-1]}]: {time_average(times, curves['queue_length'])}")
+    print(f"\tśrednia liczba obsługiwanych: {time_average(times, curves['in_service'])}")
+    # arrivals are uniform in time, so mean waiting of users arriving in [0, T] is the time average of the curve
+    print(f"\tśredni czas oczekiwania przybywających: {time_average(times, curves['waiting_time'])}")
+    print(f"\tdługość kolejki na końcu: {curves['queue_length'][-1]}, czas oczekiwania na końcu: {curves['waiting_time'][-1]}")
+    if curves['truncated_mass'].max() > 1e-6:
+        print(f"\tUWAGA: prawdopodobieństwo ostatniego stanu {curves['truncated_mass'].max()}, zwiększ --capacity")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Transient analysis of non-segmented queue by uniformization')
+    parser.add_argument('-c', '--config', default='config_queue.yaml')
+    parser.add_argument('-p', '--points', type=int, default=361, help='number of time points on [0, time]')
+    parser.add_argument('--capacity', type=int, default=None, help='truncation of the chain (users in system)')
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args()
+
+    config = load_file(args.config)
+    start = timer.perf_counter()
+    curves = transient_curves(config, args.points, args.capacity)
+    print(f'Czas obliczeń: {(timer.perf_counter() - start) * 1000:.1f} ms')
+    print_curves(curves)
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        fig, axs = plt.subplots(3, 1, figsize=(8, 6), sharex=True)
+        for ax, key, label in zip(axs, ('queue_length', 'in_service', 'waiting_time'), ('E[users in queue]', 'E[users in service]', 'E[waiting time]')):
+            ax.plot(curves['time'], curves[key])
+            ax.set_ylabel(label)
+            ax.grid(True)
+        axs[-1].set_xlabel('Time')
+        fig.tight_layout()
+        plt.show()
+
+
+if __name__ == '__main__':
+    main()